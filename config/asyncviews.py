@@ -0,0 +1,100 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+from .metrics import measure_render, measure_serialization
+from .mixins import EagerLoadingMixin, SnapshotListMixin
+from .renderers import FastJSONRenderer
+from .snapshot import aget_snapshot
+
+
+def json_response(data, status=200):
+    renderer = FastJSONRenderer()
+    with measure_render():
+        content = renderer.render(data)
+    return HttpResponse(content, status=status, content_type=renderer.media_type)
+
+
+def async_api_view(func):
+    """
+    Native async GET view returning JSON. DRF exceptions and Http404 become
+    the same error responses DRF views produce. Requests are not
+    authenticated, so this is only for public read endpoints.
+    """
+    @require_GET
+    @wraps(func)
+    async def view(request, *args, **kwargs):
+        try:
+            return await func(request, *args, **kwargs)
+        except (APIException, Http404) as exc:
+            response = exception_handler(exc, {'request': request})
+            return json_response(response.data, status=response.status_code)
+    return view
+
+
+def bind_view(view_class, request, **kwargs):
+    """
+    Instantiates a DRF view so an async view can reuse its queryset, filter
+    backends, serializer and paginator.
+    """
+    view = view_class(request=Request(request), args=(), kwargs=kwargs, format_kwarg=None)
+    view.headers = {}
+    return view
+
+
+async def aget_object(view):
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    lookup = {view.lookup_field: view.kwargs[lookup_url_kwarg]}
+    queryset = view.filter_queryset(view.get_queryset())
+    obj = await queryset.filter(**lookup).afirst()
+    if obj is None:
+        # Same message as get_object_or_404() in the sync views
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+    return obj
+
+
+def async_list_view(view_class):
+    """
+    Async counterpart of a DRF list view: same filtering, ordering,
+    pagination and serializer, with the queries run through the async ORM.
+    """
+    @async_api_view
+    async def list_view(request, **kwargs):
+        view = bind_view(view_class, request, **kwargs)
+        queryset = view.get_queryset()
+        if isinstance(view, SnapshotListMixin):
+            rows = await aget_snapshot(queryset)
+            if view.snapshot_filters_may_query():
+                rows = await sync_to_async(view.filter_snapshot)(queryset, rows)
+            else:
+                rows = view.filter_snapshot(queryset, rows)
+        else:
+            # Filters may query, e.g. to validate related ids
+            rows = await sync_to_async(view.filter_queryset)(queryset)
+            if isinstance(view, EagerLoadingMixin):
+                rows = view.get_values_queryset(rows)
+        page = await view.paginator.apaginate_queryset(rows, view.request, view)
+        with measure_serialization():
+            data = view.get_serializer(page, many=True).data
+        return json_response(view.paginator.get_paginated_response(data).data)
+    list_view.view_class = view_class
+    return list_view
+
+
+def async_detail_view(view_class):
+    """
+    Async counterpart of a DRF retrieve view.
+    """
+    @async_api_view
+    async def detail_view(request, **kwargs):
+        view = bind_view(view_class, request, **kwargs)
+        obj = await aget_object(view)
+        with measure_serialization():
+            data = view.get_serializer(obj).data
+        return json_response(data)
+    detail_view.view_class = view_class
+    return detail_view
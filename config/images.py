@@ -0,0 +1,186 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Worker threads that render variants off the request path
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+
+
+def variants_field_name(field_name):
+    return f'{field_name}_variants'
+
+
+def variant_name(name, width):
+    directory, filename = posixpath.split(name)
+    root, _ = posixpath.splitext(filename)
+    return posixpath.join(directory, 'variants', f'{root}_w{width}.webp')
+
+
+def get_variants(instance, field_name):
+    """
+    Returns {width: storage name} for the current file of the image field,
+    or {} when the variants are missing or belong to a previous upload.
+    """
+    file = getattr(instance, field_name)
+    return current_variants(file.name, getattr(instance, variants_field_name(field_name)))
+
+
+def current_variants(name, variants):
+    """
+    get_variants from the stored file name and <field>_variants value.
+    """
+    variants = variants or {}
+    if not name or variants.get('source') != name:
+        return {}
+    return {int(width): name for width, name in variants.get('sizes', {}).items()}
+
+
+def needs_variants(instance, field_name):
+    file = getattr(instance, field_name)
+    variants = getattr(instance, variants_field_name(field_name)) or {}
+    return bool(file) and variants.get('source') != file.name
+
+
+def generate_variants(instance, field_name):
+    """
+    Renders WebP copies of the image at each IMAGE_VARIANT_WIDTHS width
+    smaller than the original and records them on the instance.
+    """
+    file = getattr(instance, field_name)
+    storage = file.storage
+    with file.open('rb'), Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        sizes = {}
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            if width >= image.width:
+                continue
+            height = round(image.height * width / image.width)
+            buffer = BytesIO()
+            image.resize((width, height), Image.Resampling.LANCZOS).save(
+                buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY, method=4
+            )
+            name = variant_name(file.name, width)
+            if storage.exists(name):
+                storage.delete(name)
+            sizes[str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+
+    variants = {'source': file.name, 'sizes': sizes}
+    setattr(instance, variants_field_name(field_name), variants)
+    # Saving fires post_save so cached documents embedding the image are
+    # refreshed; needs_variants() is now False, so it isn't rescheduled.
+    instance.save(update_fields=[variants_field_name(field_name)])
+    return variants
+
+
+def _generate_variants_task(model_label, pk, field_name):
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is None or not needs_variants(instance, field_name):
+        return
+    try:
+        generate_variants(instance, field_name)
+    except Exception:
+        logger.exception("Could not generate %s variants for %s %s", field_name, model_label, pk)
+
+
+def _generate_variants_job(*args):
+    """
+    _generate_variants_task on an executor thread. Request signals never
+    reach these threads, so expired or broken connections are closed around
+    each job here instead.
+    """
+    close_old_connections()
+    try:
+        _generate_variants_task(*args)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(instance, field_name):
+    """
+    Queues variant generation for after the current transaction commits. Runs
+    inline when IMAGE_VARIANTS_ASYNC is off (tests, management commands).
+    """
+    args = (instance._meta.label, instance.pk, field_name)
+    if settings.IMAGE_VARIANTS_ASYNC:
+        transaction.on_commit(lambda: _executor.submit(_generate_variants_job, *args))
+    else:
+        transaction.on_commit(lambda: _generate_variants_task(*args))
+
+
+class ImageFieldMixin:
+    """
+    Common parts of the read-only fields rendering an image field and its
+    variants from the whole instance. to_representation_row renders from a
+    .values() row as well (see config.serializers.FastListSerializer).
+    """
+    def __init__(self, image_field, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+        self.image_field = image_field
+
+    @property
+    def source_fields(self):
+        return (self.image_field, variants_field_name(self.image_field))
+
+    def to_representation(self, instance):
+        file = getattr(instance, self.image_field)
+        return self.render(file.name, getattr(instance, variants_field_name(self.image_field)), file.storage)
+
+    def to_representation_row(self, row, get):
+        """
+        Same as to_representation, reading values with get(row, name), i.e.
+        operator.getitem for dicts or getattr for instances.
+        """
+        name = get(row, self.image_field)
+        storage = self.parent.Meta.model._meta.get_field(self.image_field).storage
+        variants = get(row, variants_field_name(self.image_field))
+        return self.render(getattr(name, 'name', name), variants, storage)
+
+
+class ImageVariantField(ImageFieldMixin, serializers.Field):
+    """
+    URL of the smallest variant of an image that is at least `width` wide,
+    falling back to the original file.
+    """
+    def __init__(self, image_field, width, **kwargs):
+        super().__init__(image_field, **kwargs)
+        self.width = width
+
+    def render(self, name, variants, storage):
+        if not name:
+            return None
+        variants = current_variants(name, variants)
+        candidates = sorted(width for width in variants if width >= self.width)
+        url = storage.url(variants[candidates[0]] if candidates else name)
+        return build_url(self.context.get('request'), url)
+
+
+class ImageSrcsetField(ImageFieldMixin, serializers.Field):
+    """
+    `srcset` attribute value listing every variant of an image.
+    """
+    def render(self, name, variants, storage):
+        if not name:
+            return None
+        request = self.context.get('request')
+        return ', '.join(
+            f'{build_url(request, storage.url(variant))} {width}w'
+            for width, variant in sorted(current_variants(name, variants).items())
+        ) or None
+
+
+def build_url(request, url):
+    return request.build_absolute_uri(url) if request is not None else url
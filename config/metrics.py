@@ -0,0 +1,255 @@
+import hmac
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request being handled, set by RequestMetricsMiddleware
+_current = ContextVar('request_metrics', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestMetrics:
+    """
+    What one request spent: its queries (SQL kept only up to
+    METRICS_MAX_LOGGED_QUERIES, for the slow request log), DB time,
+    serializer time and response rendering time.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.queries = []
+
+    def record_query(self, sql, duration):
+        self.query_count += 1
+        self.db_time += duration
+        if len(self.queries) < settings.METRICS_MAX_LOGGED_QUERIES:
+            self.queries.append((sql, duration))
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection, timing queries for the
+    request being handled, if any.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """
+    Cumulative Prometheus histogram with one series per label tuple.
+    Process-local, so each worker exposes its own.
+    """
+    def __init__(self, name, help_text, buckets, labels=('route', 'method')):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}  # {label values: [bucket counts..., +Inf count, sum]}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for label_values, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labels, label_values))
+            count = 0
+            for bound, observed in zip((*self.buckets, '+Inf'), values):
+                count += observed
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return '\n'.join(lines)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'kino_request_duration_seconds', "Time spent handling the request.", DURATION_BUCKETS
+)
+DB_DURATION = Histogram(
+    'kino_db_duration_seconds', "Time spent in database queries per request.", DURATION_BUCKETS
+)
+DB_QUERIES = Histogram('kino_db_queries', "Database queries per request.", QUERY_BUCKETS)
+SERIALIZE_DURATION = Histogram(
+    'kino_serialize_duration_seconds', "Time spent building serializer data per request.", DURATION_BUCKETS
+)
+RENDER_DURATION = Histogram(
+    'kino_render_duration_seconds', "Time spent rendering the response body per request.", DURATION_BUCKETS
+)
+RESPONSE_SIZE = Histogram('kino_response_size_bytes', "Response body size.", SIZE_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, SERIALIZE_DURATION, RENDER_DURATION, RESPONSE_SIZE)
+
+
+@contextmanager
+def measure(attribute):
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            setattr(metrics, attribute, getattr(metrics, attribute) + time.perf_counter() - started)
+
+
+def measure_render():
+    """
+    Counts the block as rendering time of the current request, for
+    responses rendered outside TemplateResponse.render().
+    """
+    return measure('render_time')
+
+
+def measure_serialization():
+    """
+    Counts the block, typically reading a serializer's .data, as
+    serialization time of the current request. Queries it runs count as DB
+    time as well.
+    """
+    return measure('serialize_time')
+
+
+def route_name(request):
+    match = request.resolver_match
+    return match.view_name if match is not None else 'unmatched'
+
+
+def finish_request(request, response, metrics):
+    """
+    Records metrics into the histograms, adds the Server-Timing header and
+    logs the SQL of a sample of the slow requests.
+    """
+    total = time.perf_counter() - metrics.started
+    labels = (route_name(request), request.method)
+    REQUEST_DURATION.observe(labels, total)
+    DB_DURATION.observe(labels, metrics.db_time)
+    DB_QUERIES.observe(labels, metrics.query_count)
+    SERIALIZE_DURATION.observe(labels, metrics.serialize_time)
+    RENDER_DURATION.observe(labels, metrics.render_time)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(labels, len(response.content))
+
+    response['Server-Timing'] = ', '.join([
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.query_count} queries"',
+        f'serialize;dur={metrics.serialize_time * 1000:.1f}',
+        f'render;dur={metrics.render_time * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+    if total * 1000 >= settings.SLOW_REQUEST_MS and random.random() < settings.SLOW_REQUEST_SAMPLE_RATE:
+        logger.warning(
+            "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms\n%s",
+            request.method, request.get_full_path(), labels[0], total * 1000,
+            metrics.query_count, metrics.db_time * 1000,
+            '\n'.join(f'[{duration * 1000:.1f} ms] {sql}' for sql, duration in metrics.queries),
+        )
+
+
+class RequestMetricsMiddleware:
+    """
+    Times each request, its queries, its serializers (where views use
+    measure_serialization) and the rendering of its response, for the
+    Server-Timing header and the histograms behind metrics_view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        connection_created.connect(install_query_recorder)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        finish_request(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        finish_request(request, response, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # Runs right before DRF/template responses are rendered
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+            response.add_post_render_callback(rendered)
+        return response
+
+
+@require_GET
+def metrics_view(request):
+    """
+    The request histograms in Prometheus text format. Requires
+    `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set, and
+    is only served with DEBUG on otherwise.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    body = '\n'.join(histogram.expose() for histogram in HISTOGRAMS) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,229 @@
+from functools import cmp_to_key
+
+from django.db.models import QuerySet
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+from rest_framework import filters, serializers
+from rest_framework.response import Response
+from .metrics import measure_serialization
+from .pagination import OrderedRows, compare_positions, get_ordering_keys, get_position
+from .serializers import (
+    EXPAND_QUERY_PARAM,
+    FIELDS_QUERY_PARAM,
+    SparseFieldsMixin,
+    get_source_columns,
+    get_values_columns,
+    is_sparse_request,
+    parse_field_list
+)
+from .snapshot import get_snapshot
+
+# Cache of (select_related, prefetch_related) lookups per serializer class
+_eager_cache = {}
+# Same, plus the columns to load and the .values() columns, per serializer
+# class, ?fields=/?expand= and annotations
+_sparse_cache = {}
+SPARSE_CACHE_SIZE = 1024
+
+
+def get_eager_relations(serializer_class):
+    """
+    Walk the serializer tree and collect the select_related/prefetch_related
+    lookups needed to render it without per-row queries.
+    """
+    if serializer_class not in _eager_cache:
+        _eager_cache[serializer_class] = _collect_relations(serializer_class())
+    return _eager_cache[serializer_class]
+
+
+def _collect_relations(serializer, prefix='', many=False):
+    select_related, prefetch_related = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        source = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.ListSerializer):
+            prefetch_related.append(source)
+            if isinstance(field.child, serializers.BaseSerializer):
+                nested_select, nested_prefetch = _collect_relations(field.child, source + '__', many=True)
+                prefetch_related += nested_select + nested_prefetch
+        elif isinstance(field, serializers.ManyRelatedField):
+            prefetch_related.append(source)
+        elif isinstance(field, serializers.BaseSerializer):
+            # Forward FK/one-to-one: join it unless we're already under a prefetch
+            (prefetch_related if many else select_related).append(source)
+            nested_select, nested_prefetch = _collect_relations(field, source + '__', many=many)
+            select_related += nested_select
+            prefetch_related += nested_prefetch
+    return select_related, prefetch_related
+
+
+def eager_load(queryset, serializer_class):
+    """
+    Apply the eager-loading lookups of serializer_class to queryset.
+    """
+    select_related, prefetch_related = get_eager_relations(serializer_class)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    return queryset
+
+
+class EagerLoadingMixin:
+    """
+    Eager-loads the relations rendered by the view's serializer so list and
+    detail endpoints run a fixed number of queries. On GET, columns the
+    serializer doesn't render are deferred, and with ?fields=/?expand= only
+    the relations still rendered are loaded. List pages of serializers using
+    FastListSerializer are fetched as .values() rows.
+    """
+    sparse_queryset = True
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if self.uses_sparse_fields(serializer_class):
+            select_related, prefetch_related, _, _ = self.get_sparse_plan(queryset)
+            if select_related:
+                queryset = queryset.select_related(*select_related)
+            if prefetch_related:
+                queryset = queryset.prefetch_related(*prefetch_related)
+            return queryset
+        return eager_load(queryset, serializer_class)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.sparse_queryset and self.request.method == 'GET':
+            _, _, columns, _ = self.get_sparse_plan(queryset)
+            if columns is not None:
+                queryset = queryset.only(*columns, *self.get_ordering_columns(queryset))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # ListModelMixin.list, timing the serializer
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            with measure_serialization():
+                data = self.get_serializer(page, many=True).data
+            return self.get_paginated_response(data)
+        with measure_serialization():
+            data = self.get_serializer(queryset, many=True).data
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        # RetrieveModelMixin.retrieve, timing the serializer
+        instance = self.get_object()
+        with measure_serialization():
+            data = self.get_serializer(instance).data
+        return Response(data)
+
+    def paginate_queryset(self, queryset):
+        return super().paginate_queryset(self.get_values_queryset(queryset))
+
+    def get_values_queryset(self, queryset):
+        """
+        queryset as .values() rows on GET when the serializer can render
+        from them, so a page skips model instantiation as well.
+        """
+        if not (self.sparse_queryset and self.request.method == 'GET' and isinstance(queryset, QuerySet)):
+            return queryset
+        _, _, _, columns = self.get_sparse_plan(queryset)
+        if columns is None or queryset.query.values_select:
+            return queryset
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['pk']
+        keys = [name for name, _ in get_ordering_keys(queryset.model, ordering, queryset.query.annotations)]
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*columns, *keys]))
+
+    def uses_sparse_fields(self, serializer_class):
+        return (
+            self.sparse_queryset and issubclass(serializer_class, SparseFieldsMixin)
+            and is_sparse_request(self.request)
+        )
+
+    def get_sparse_plan(self, queryset):
+        """
+        (select_related, prefetch_related, columns, values_columns) for the
+        serializer as shaped by this request.
+        """
+        key = (
+            self.get_serializer_class(),
+            tuple(sorted(parse_field_list(self.request, FIELDS_QUERY_PARAM) or ())),
+            tuple(sorted(parse_field_list(self.request, EXPAND_QUERY_PARAM) or ())),
+            tuple(queryset.query.annotations),
+        )
+        if key not in _sparse_cache:
+            if len(_sparse_cache) >= SPARSE_CACHE_SIZE:
+                # Keys come from the query string, so keep the cache bounded
+                _sparse_cache.clear()
+            serializer = self.get_serializer()
+            select_related, prefetch_related = _collect_relations(serializer)
+            annotations = queryset.query.annotations
+            columns = get_source_columns(serializer, queryset.model, annotations)
+            values_columns = get_values_columns(serializer, annotations)
+            _sparse_cache[key] = (select_related, prefetch_related, columns, values_columns)
+        return _sparse_cache[key]
+
+    def get_ordering_columns(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        opts = queryset.model._meta
+        return [
+            opts.get_field(name).name for name, _ in get_ordering_keys(queryset.model, ordering)
+            if name not in queryset.query.annotations
+        ]
+
+
+class SnapshotListMixin:
+    """
+    Serves GET lists of a small, rarely written table from a process-local
+    snapshot. Exact filterset_fields filters, search_fields and
+    ordering_fields are applied in memory with the same semantics as the
+    database-backed filter backends, including a 400 for filter values the
+    filterset rejects.
+    """
+    # The snapshot is shared by every request, so it is always loaded whole
+    sparse_queryset = False
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        rows = self.filter_snapshot(queryset, get_snapshot(queryset))
+        page = self.paginate_queryset(rows)
+        with measure_serialization():
+            data = self.get_serializer(rows if page is None else page, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def snapshot_filters_may_query(self):
+        """
+        Whether filter_snapshot() may query, to validate a choice filter.
+        """
+        return any(name in self.request.query_params for name in getattr(self, 'filterset_fields', []))
+
+    def filter_snapshot(self, queryset, rows):
+        model = queryset.model
+        filterset = DjangoFilterBackend().get_filterset(self.request, queryset, self)
+        if filterset is not None:
+            if not filterset.is_valid():
+                raise translate_validation(filterset.errors)
+            for name, value in filterset.form.cleaned_data.items():
+                if value in (None, ''):
+                    continue
+                attname = model._meta.get_field(filterset.filters[name].field_name).attname
+                value = getattr(value, 'pk', value)  # ModelChoiceFilter
+                rows = [row for row in rows if getattr(row, attname) == value]
+
+        terms = [term.lower() for term in filters.SearchFilter().get_search_terms(self.request)]
+        if terms:
+            fields = getattr(self, 'search_fields', [])
+            rows = [
+                row for row in rows
+                if all(any(term in str(getattr(row, field) or '').lower() for field in fields) for term in terms)
+            ]
+
+        ordering = filters.OrderingFilter().get_ordering(self.request, queryset, self) or ['pk']
+        keys = get_ordering_keys(model, ordering)
+        rows = sorted(rows, key=cmp_to_key(
+            lambda a, b: compare_positions(get_position(a, keys), get_position(b, keys), keys)
+        ))
+        return OrderedRows(rows, keys)
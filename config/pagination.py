@@ -0,0 +1,266 @@
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def get_ordering_keys(model, ordering, annotations=()):
+    """
+    Returns ordering as [(attname or annotation, descending)], ending with
+    the pk so every position is unique.
+    """
+    opts = model._meta
+    keys = []
+    for item in ordering:
+        if not isinstance(item, str):
+            continue
+        desc = item.startswith('-')
+        name = item.lstrip('-')
+        if name in annotations:
+            keys.append((name, desc))
+            continue
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        keys.append((field.attname, desc))
+        if field.primary_key:
+            return keys
+    keys.append((opts.pk.attname, keys[0][1] if keys else False))
+    return keys
+
+
+def get_position(obj, keys):
+    if isinstance(obj, dict):
+        return [obj[name] for name, _ in keys]
+    return [getattr(obj, name) for name, _ in keys]
+
+
+def compare_positions(a, b, keys):
+    """
+    Compares two positions under keys, sorting NULLs last. Returns -1, 0 or 1.
+    """
+    for (_, desc), x, y in zip(keys, a, b):
+        if x == y:
+            continue
+        if x is None or y is None:
+            return 1 if x is None else -1
+        result = -1 if x < y else 1
+        return -result if desc else result
+    return 0
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder without its rounding of times to milliseconds: a
+    cursor position has to compare equal to the row it was taken from.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class OrderedRows(list):
+    """
+    In-memory rows already sorted by keys, as produced by get_ordering_keys.
+    KeysetPagination paginates these without touching the database.
+    """
+    def __init__(self, rows, keys):
+        super().__init__(rows)
+        self.keys = keys
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over the view's ordering, with `id` appended as a
+    tiebreaker so every position is unique.
+
+    Cursors are opaque and the total count is skipped unless `?count=1` is
+    passed. Sending `?page=<n>` opts into classic page-number pagination,
+    which the admin UI relies on. Malformed cursors, and ones taken under
+    another ordering, are rejected with a 400.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_number_class = PageNumberPagination
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_page_numbers(request):
+            return self.page_number.paginate_queryset(queryset, request, view)
+
+        position = self.start(queryset, request)
+        if isinstance(queryset, OrderedRows):
+            self.count = len(queryset) if self.include_count(request) else None
+            results = self.seek_rows(queryset, position)
+        else:
+            self.count = queryset.count() if self.include_count(request) else None
+            results = list(self.seek_queryset(queryset, position))
+        return self.finish(results, position)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset for async views, using the async ORM.
+        """
+        if self.use_page_numbers(request):
+            return await sync_to_async(self.page_number.paginate_queryset)(queryset, request, view)
+
+        position = self.start(queryset, request)
+        if isinstance(queryset, OrderedRows):
+            self.count = len(queryset) if self.include_count(request) else None
+            results = self.seek_rows(queryset, position)
+        else:
+            self.count = await queryset.acount() if self.include_count(request) else None
+            results = [obj async for obj in self.seek_queryset(queryset, position)]
+        return self.finish(results, position)
+
+    def use_page_numbers(self, request):
+        self.request = request
+        self.page_number = None
+        if self.page_number_class.page_query_param in request.query_params:
+            self.page_number = self.page_number_class()
+        return self.page_number is not None
+
+    def start(self, queryset, request):
+        self.base_url = request.build_absolute_uri()
+        self.keys = self.get_keys(queryset)
+        position, self.reverse = self.decode_cursor(request)
+        return position
+
+    def finish(self, results, position):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def seek_queryset(self, queryset, position):
+        keys = [(name, desc != self.reverse) for name, desc in self.keys]
+        nullable = {f.attname for f in queryset.model._meta.concrete_fields if f.null}
+        # Only nullable columns get a NULLS clause: on NOT NULL columns it
+        # would stop Postgres from walking a plain (col, id) index in order
+        nulls = {'nulls_first': True} if self.reverse else {'nulls_last': True}
+        queryset = queryset.order_by(*[
+            getattr(F(name), 'desc' if desc else 'asc')(**(nulls if name in nullable else {}))
+            for name, desc in keys
+        ])
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.after(keys, position, nullable))
+            except (TypeError, ValueError, DjangoValidationError):
+                # a position value the column can't take
+                raise self.invalid_cursor()
+        return queryset[:self.page_size + 1]
+
+    def seek_rows(self, rows, position):
+        """
+        Same as seek_queryset for rows that are already sorted in memory.
+        """
+        if position is not None:
+            sign = -1 if self.reverse else 1
+            try:
+                rows = [
+                    row for row in rows
+                    if compare_positions(get_position(row, self.keys), position, self.keys) * sign > 0
+                ]
+            except TypeError:
+                raise self.invalid_cursor()
+        if self.reverse:
+            return rows[::-1][:self.page_size + 1]
+        return rows[:self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        if self.page_number is not None:
+            return self.page_number.get_paginated_response(data)
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true')
+
+    def get_keys(self, queryset):
+        if isinstance(queryset, OrderedRows):
+            return queryset.keys
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['pk']
+        return get_ordering_keys(queryset.model, ordering, queryset.query.annotations)
+
+    def after(self, keys, position, nullable=()):
+        """
+        Builds a filter matching rows strictly after position in the given
+        ordering, where NULLs sort last going forward and first in reverse.
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, desc), value in zip(keys, position):
+            if value is None:
+                if self.reverse:
+                    condition |= equal & Q(**{f'{name}__isnull': False})
+                equal &= Q(**{f'{name}__isnull': True})
+            else:
+                step = Q(**{f'{name}__{"lt" if desc else "gt"}': value})
+                if not self.reverse and name in nullable:
+                    step |= Q(**{f'{name}__isnull': True})
+                condition |= equal & step
+                equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, obj, reverse):
+        payload = {
+            'o': self.keys,
+            'p': get_position(obj, self.keys),
+            'r': reverse,
+        }
+        token = urlsafe_b64encode(json.dumps(payload, cls=CursorEncoder).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()))
+            keys = [(name, desc) for name, desc in payload['o']]
+            position, reverse = list(payload['p']), bool(payload['r'])
+        except (TypeError, ValueError, KeyError):
+            raise self.invalid_cursor()
+        if keys != self.keys or len(position) != len(keys):
+            # taken under another ordering
+            raise self.invalid_cursor()
+        return position, reverse
+
+    def invalid_cursor(self):
+        return ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
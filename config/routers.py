@@ -0,0 +1,160 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Routing state of the request being handled, set by replica_routing_middleware
+_state = ContextVar('db_routing_state', default=None)
+
+
+def sticky_cache_key(user_id):
+    return f'db-primary:{user_id}'
+
+
+def token_user_id(request):
+    """
+    User id of a valid JWT access token on request, without touching the
+    database, or None.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+class RoutingState:
+    """
+    Where the reads of one request go. A request reads from a single
+    replica, picked on its first query, unless it isn't a safe-method
+    request to a view in REPLICA_ROUTED_APPS, its user wrote within the
+    last REPLICA_STICKY_SECONDS, or it has written itself.
+    """
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        self.primary = 0
+        self.alias = None
+
+    @cached_property
+    def user_id(self):
+        return token_user_id(self.request)
+
+    def read_alias(self):
+        if self.wrote or self.primary:
+            return DEFAULT_DB_ALIAS
+        if self.alias is None:
+            self.alias = random.choice(settings.DATABASE_REPLICAS) if self.uses_replicas() else DEFAULT_DB_ALIAS
+        return self.alias
+
+    def uses_replicas(self):
+        if not settings.DATABASE_REPLICAS or self.request.method not in SAFE_METHODS:
+            return False
+        match = self.request.resolver_match
+        view = getattr(match.func, 'view_class', match.func) if match is not None else None
+        if view is None or view.__module__.split('.')[0] not in settings.REPLICA_ROUTED_APPS:
+            return False
+        return self.user_id is None or not cache.get(sticky_cache_key(self.user_id))
+
+    def finish(self):
+        """
+        Keeps the user on the primary for a while after a write, so they
+        read their own writes whatever the replication lag. Like the other
+        shared counters, this only spans workers with a shared cache.
+        """
+        if self.wrote and self.user_id is not None:
+            cache.set(sticky_cache_key(self.user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+    async def afinish(self):
+        if self.wrote and self.user_id is not None:
+            await cache.aset(sticky_cache_key(self.user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """
+    Tracks the routing state ReplicaRouter reads for each request.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = RoutingState(request)
+            token = _state.set(state)
+            try:
+                response = await get_response(request)
+                await state.afinish()
+                return response
+            finally:
+                _state.reset(token)
+    else:
+        def middleware(request):
+            state = RoutingState(request)
+            token = _state.set(state)
+            try:
+                response = get_response(request)
+                state.finish()
+                return response
+            finally:
+                _state.reset(token)
+    return middleware
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Sends the reads of the current request to the primary inside the block,
+    for results that outlive the request, e.g. ones written to a cache.
+    """
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    state.primary += 1
+    try:
+        yield
+    finally:
+        state.primary -= 1
+
+
+class ReplicaRouter:
+    """
+    Writes go to the primary (`default`) and reads to the alias the request's
+    RoutingState picks. Outside a request, e.g. in management commands,
+    reads use the primary as well. Replicas are copies of the primary, so
+    relations across aliases are fine and nothing is migrated on them.
+    """
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db and not (state.wrote or state.primary):
+            # Related objects come from wherever the instance came from
+            return instance._state.db
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in settings.DATABASE_REPLICAS else None
@@ -0,0 +1,192 @@
+from operator import getitem
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.manager import BaseManager
+from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+FIELDS_QUERY_PARAM = 'fields'
+EXPAND_QUERY_PARAM = 'expand'
+
+
+def parse_field_list(request, param):
+    """
+    Comma-separated names from ?<param>=, or None when it wasn't sent.
+    """
+    if request is None or param not in request.GET:
+        return None
+    return {name.strip() for name in request.GET[param].split(',') if name.strip()}
+
+
+def is_sparse_request(request):
+    return request is not None and (FIELDS_QUERY_PARAM in request.GET or EXPAND_QUERY_PARAM in request.GET)
+
+
+class SparseFieldsMixin:
+    """
+    Lets the client shape the top-level serializer of a response:
+    ?fields=a,b keeps only those fields and ?expand=x,y adds fields listed in
+    Meta.expandable_fields, which are left out otherwise. Naming an
+    expandable field in ?fields= expands it too. Unknown names are ignored,
+    and so are both parameters on writes.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable_fields', ())
+        request = self.context.get('request') if self.is_root() else None
+        if request is not None and request.method not in ('GET', 'HEAD'):
+            request = None
+        requested = parse_field_list(request, FIELDS_QUERY_PARAM)
+        expand = (parse_field_list(request, EXPAND_QUERY_PARAM) or set()) | (requested or set())
+        for name in list(fields):
+            if (name in expandable and name not in expand) or (requested is not None and name not in requested):
+                del fields[name]
+        return fields
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+def get_source_columns(serializer, model, annotations=()):
+    """
+    Model fields serializer reads, for QuerySet.only(), or None when a field
+    reads something that can't be told from its source (a method field, a
+    property), in which case nothing should be deferred.
+    """
+    opts = model._meta
+    columns = {opts.pk.name}
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            sources = getattr(field, 'source_fields', None)
+            if sources is None:
+                return None
+            columns.update(sources)
+            continue
+        name = field.source.split('.')[0]
+        if name in annotations:
+            continue
+        try:
+            model_field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if model_field.many_to_many or model_field.one_to_many:
+            continue  # prefetched
+        if not model_field.concrete:
+            return None
+        columns.add(model_field.name)
+    return columns
+
+
+# Field classes whose to_representation returns values of this type unchanged
+_PASSTHROUGH_TYPES = [
+    (serializers.CharField, str),
+    (serializers.IntegerField, int),
+    (serializers.BooleanField, bool),
+]
+
+
+class FastListSerializer(serializers.ListSerializer):
+    """
+    list_serializer_class for flat, read-only serializers. Each field gets
+    a converter built once per response that reads its column straight from
+    the row, which can be a model instance or a .values() dict, instead of
+    going through DRF's per-field get_attribute()/to_representation() for
+    every row. The output is the same; serializers with a field that has no
+    converter (relations, method fields, dotted sources) use the regular
+    path.
+    """
+    def to_representation(self, data):
+        converters = get_row_converters(self.child)
+        if converters is None:
+            return super().to_representation(data)
+        rows = data.all() if isinstance(data, BaseManager) else data
+        rows = rows if isinstance(rows, list) else list(rows)
+        get = getitem if rows and isinstance(rows[0], dict) else getattr
+        return [{name: convert(row, get) for name, convert in converters} for row in rows]
+
+
+def get_row_converters(serializer, annotations=None):
+    """
+    [(name, convert)] for the readable fields of serializer, where
+    convert(row, get) renders the field from a row, or None when a field
+    can't be rendered that way. With annotations given, fields reading
+    neither a model column nor one of them are refused as well.
+    """
+    converters = []
+    for field in serializer._readable_fields:
+        convert = _row_converter(field, serializer.Meta.model, annotations)
+        if convert is None:
+            return None
+        converters.append((field.field_name, convert))
+    return converters
+
+
+def get_values_columns(serializer, annotations=()):
+    """
+    Columns to pass to QuerySet.values() for serializer to render from the
+    rows through FastListSerializer, or None when it doesn't use one or
+    can't.
+    """
+    if not issubclass(getattr(serializer.Meta, 'list_serializer_class', type), FastListSerializer):
+        return None
+    if get_row_converters(serializer, annotations) is None:
+        return None
+    columns = []
+    for field in serializer._readable_fields:
+        columns.extend(getattr(field, 'source_fields', None) or [field.source])
+    return list(dict.fromkeys(columns))
+
+
+def _row_converter(field, model, annotations):
+    if hasattr(field, 'to_representation_row'):
+        return field.to_representation_row
+    if isinstance(field, (serializers.BaseSerializer, serializers.RelatedField, serializers.ManyRelatedField)):
+        return None
+    column = field.source
+    if column == '*' or '.' in column:
+        return None
+    try:
+        model_field = model._meta.get_field(column)
+    except FieldDoesNotExist:
+        # An annotation, unless it names a property or method of the model
+        if hasattr(model, column) or (annotations is not None and column not in annotations):
+            return None
+        model_field = None
+    else:
+        if not model_field.concrete or model_field.is_relation:
+            return None
+
+    if isinstance(field, serializers.FileField):
+        return _file_converter(field, column, model_field.storage) if model_field else None
+    passthrough = next(
+        (kind for cls, kind in _PASSTHROUGH_TYPES if type(field).to_representation is cls.to_representation), None
+    )
+    to_representation = field.to_representation
+
+    def convert(row, get):
+        value = get(row, column)
+        if value is None or type(value) is passthrough:
+            return value
+        return to_representation(value)
+    return convert
+
+
+def _file_converter(field, column, storage):
+    use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+    request = field.context.get('request')
+
+    def convert(row, get):
+        name = get(row, column)
+        name = getattr(name, 'name', name)
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return convert
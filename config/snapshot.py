@@ -0,0 +1,65 @@
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Process-local snapshots: {model label: (version, rows)}
+_snapshots = {}
+
+
+def _version_key(model):
+    return f'snapshot-version:{model._meta.label_lower}'
+
+
+def _initial_version():
+    # Not a fixed number: after a cache flush, a counter restarting at the
+    # same value would match snapshots loaded before it
+    return time.time_ns()
+
+
+def get_snapshot_version(model):
+    return cache.get_or_set(_version_key(model), _initial_version, timeout=None)
+
+
+def bump_snapshot_version(model):
+    """
+    Invalidates every process's snapshot of model. The counter lives in the
+    shared cache, so this only reaches other workers when CACHES points at a
+    shared backend.
+    """
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def get_snapshot(queryset):
+    """
+    Returns every row of queryset as a list, reloading it only when the
+    model's shared version counter has moved. Rows are read from the
+    primary, since a lagging replica could pin a stale snapshot to the new
+    version.
+    """
+    model = queryset.model
+    label = model._meta.label_lower
+    version = get_snapshot_version(model)
+    snapshot = _snapshots.get(label)
+    if snapshot is None or snapshot[0] != version:
+        snapshot = (version, list(queryset.using(DEFAULT_DB_ALIAS)))
+        _snapshots[label] = snapshot
+    return snapshot[1]
+
+
+async def aget_snapshot(queryset):
+    """
+    get_snapshot for async views.
+    """
+    model = queryset.model
+    label = model._meta.label_lower
+    version = await cache.aget_or_set(_version_key(model), _initial_version, timeout=None)
+    snapshot = _snapshots.get(label)
+    if snapshot is None or snapshot[0] != version:
+        snapshot = (version, [row async for row in queryset.using(DEFAULT_DB_ALIAS)])
+        _snapshots[label] = snapshot
+    return snapshot[1]
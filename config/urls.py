@@ -18,11 +18,17 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/films/', include('films.urls')),
+    # Native async read endpoints, for ASGI deployments (config/asgi.py)
+    path('api/async/auth/', include('users.async_urls')),
+    path('api/async/films/', include('films.async_urls')),
+    # Prometheus scrape target
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,20 @@
+from django.urls import path
+from .async_views import (
+    genre_list,
+    theme_list,
+    country_list,
+    language_list,
+    studio_list,
+    film_list,
+    film_detail
+)
+
+urlpatterns = [
+    path('genres/', genre_list, name='genre-list-async'),
+    path('themes/', theme_list, name='theme-list-async'),
+    path('countries/', country_list, name='country-list-async'),
+    path('languages/', language_list, name='language-list-async'),
+    path('studios/', studio_list, name='studio-list-async'),
+    path('films/', film_list, name='film-list-async'),
+    path('films/<int:pk>/', film_detail, name='film-detail-async'),
+]
@@ -0,0 +1,46 @@
+from config.asyncviews import aget_object, async_api_view, async_list_view, bind_view, json_response
+from config.metrics import measure_serialization
+from config.routers import read_from_primary
+from config.serializers import is_sparse_request
+from .cache import aget_film_detail, aget_film_generation, aset_film_detail
+from .views import (
+    GenreListCreateView,
+    ThemeListCreateView,
+    CountryListCreateView,
+    LanguageListCreateView,
+    StudioListCreateView,
+    FilmListCreateView,
+    FilmRetrieveUpdateDestroyView
+)
+
+# Async (ASGI) read-only counterparts of the hot GET endpoints in views.py
+
+# 1. Taxonomy lists
+genre_list = async_list_view(GenreListCreateView)
+theme_list = async_list_view(ThemeListCreateView)
+country_list = async_list_view(CountryListCreateView)
+language_list = async_list_view(LanguageListCreateView)
+studio_list = async_list_view(StudioListCreateView)
+
+# 2. Film list
+film_list = async_list_view(FilmListCreateView)
+
+# 3. Film detail (shares the response cache with the sync view)
+@async_api_view
+async def film_detail(request, pk):
+    view = bind_view(FilmRetrieveUpdateDestroyView, request, pk=pk)
+    if is_sparse_request(request):
+        obj = await aget_object(view)
+        with measure_serialization():
+            data = view.get_serializer(obj).data
+        return json_response(data)
+    host = request.get_host()
+    generation = await aget_film_generation(pk)
+    data = await aget_film_detail(pk, host, generation)
+    if data is None:
+        with read_from_primary():
+            obj = await aget_object(view)
+            with measure_serialization():
+                data = view.get_serializer(obj).data
+        await aset_film_detail(pk, host, generation, data)
+    return json_response(data)
@@ -0,0 +1,35 @@
+from itertools import islice
+from .models import Film
+
+RELATION_FIELDS = ('genres', 'themes', 'studios', 'countries', 'languages')
+
+
+def bulk_set_relations(films, replace=(), batch_size=5000):
+    """
+    Writes the M2M rows for films, an iterable of (film, {field: [ids]}),
+    with bulk inserts of at most batch_size rows. Fields missing from a
+    film's dict are left untouched; for films whose pk is in replace, the
+    existing rows of the fields given are deleted first.
+    """
+    films = list(films)
+    for field in RELATION_FIELDS:
+        descriptor = getattr(Film, field)
+        through = descriptor.through
+        target = descriptor.field.m2m_reverse_field_name()
+        replaced = [film.pk for film, relations in films if film.pk in replace and field in relations]
+        if replaced:
+            through.objects.filter(film_id__in=replaced).delete()
+        rows = (
+            through(film_id=film.pk, **{f'{target}_id': pk})
+            for film, relations in films
+            for pk in dict.fromkeys(relations.get(field, []))
+        )
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            through.objects.bulk_create(chunk)
+    # Bulk inserts send no m2m_changed, so flag similar films here
+    changed = [film.pk for film, relations in films if relations]
+    if changed:
+        Film.objects.filter(pk__in=changed).update(similarity_stale=True)
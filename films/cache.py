@@ -0,0 +1,68 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .serializers import FilmDetailSerializer
+
+
+def get_cache():
+    return caches[settings.FILM_DETAIL_CACHE_ALIAS]
+
+
+def film_generation_key(pk):
+    return f'film-detail:v{FilmDetailSerializer.cache_version}:{pk}'
+
+
+def film_detail_cache_key(pk, generation, host):
+    return f'film-detail:v{FilmDetailSerializer.cache_version}:{pk}:{generation}:{host}'
+
+
+def new_generation():
+    return uuid4().hex
+
+
+def get_film_generation(pk):
+    """
+    Returns the current generation of film pk's cached details, starting a
+    new one if it was invalidated. Each host's rendering (image URLs are
+    absolute) is cached under its own key within the generation, so
+    invalidating only has to drop the generation. Read it before rendering:
+    a rendering started before an invalidation then lands in the dropped
+    generation instead of outliving it.
+    """
+    return get_cache().get_or_set(film_generation_key(pk), new_generation, timeout=None)
+
+
+def get_film_detail(pk, host, generation):
+    """
+    Returns the cached FilmDetailSerializer data for film pk rendered for
+    host, or None on a miss.
+    """
+    return get_cache().get(film_detail_cache_key(pk, generation, host))
+
+
+def set_film_detail(pk, host, generation, data):
+    get_cache().set(film_detail_cache_key(pk, generation, host), data, settings.FILM_DETAIL_CACHE_TIMEOUT)
+
+
+async def aget_film_generation(pk):
+    return await get_cache().aget_or_set(film_generation_key(pk), new_generation, timeout=None)
+
+
+async def aget_film_detail(pk, host, generation):
+    return await get_cache().aget(film_detail_cache_key(pk, generation, host))
+
+
+async def aset_film_detail(pk, host, generation, data):
+    await get_cache().aset(film_detail_cache_key(pk, generation, host), data, settings.FILM_DETAIL_CACHE_TIMEOUT)
+
+
+def invalidate_film_details(pks):
+    """
+    Drops the cached details of every film in pks, for all hosts, once the
+    current transaction commits, so readers can't re-cache uncommitted state.
+    """
+    keys = [film_generation_key(pk) for pk in set(pks)]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
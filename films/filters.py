@@ -0,0 +1,177 @@
+from django import forms
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, models
+from django.db.models import Case, Exists, F, FloatField, OuterRef, Q, Value, When
+from django.db.models.functions import Cast, Concat, Length
+from django_filters import rest_framework as django_filters
+from django_filters.widgets import BaseCSVWidget
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from .models import FILM_SEARCH_CONFIG, Film, autocomplete_key
+
+# Shorter terms only match prefixes: trigram indexes can't serve them
+AUTOCOMPLETE_MIN_SUBSTRING = 3
+
+
+class FilmSearchFilter(filters.SearchFilter):
+    """
+    Full-text search over Film.search_vector, ranked by relevance unless the
+    client asked for an explicit ordering. Falls back to the default
+    icontains search on non-PostgreSQL databases.
+    """
+    def filter_queryset(self, request, queryset, view):
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+
+        query = SearchQuery(terms, config=FILM_SEARCH_CONFIG, search_type='websearch')
+        # ts_rank() is a float4, which wouldn't compare equal to the float8 it
+        # becomes in a keyset cursor; as a float8 the cursor round-trips exactly
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+        if filters.OrderingFilter.ordering_param not in request.query_params:
+            queryset = queryset.order_by('-rank', 'id')
+        return queryset
+
+
+def autocomplete(queryset, fields, term, limit):
+    """
+    Rows of queryset with term in one of fields, ignoring case and accents.
+    Matches at the start of a field rank first, then at the start of a word,
+    then shorter values of fields[0]. On PostgreSQL the lookups go through
+    the autocomplete_key indexes; elsewhere they fall back to
+    istartswith/icontains.
+    """
+    substring = len(term) >= AUTOCOMPLETE_MIN_SUBSTRING
+    if connection.vendor == 'postgresql':
+        names = [f'{field}_key' for field in fields]
+        queryset = queryset.alias(**{name: autocomplete_key(F(field)) for name, field in zip(names, fields)})
+        term, word = autocomplete_key(Value(term)), Concat(Value(' '), autocomplete_key(Value(term)))
+        prefix_lookup, contains_lookup = 'startswith', 'contains'
+    else:
+        names, word = fields, ' ' + term
+        prefix_lookup, contains_lookup = 'istartswith', 'icontains'
+    prefix, word_prefix, match = Q(), Q(), Q()
+    for name in names:
+        prefix |= Q(**{f'{name}__{prefix_lookup}': term})
+        word_prefix |= Q(**{f'{name}__{contains_lookup}': word})
+        match |= Q(**{f'{name}__{contains_lookup if substring else prefix_lookup}': term})
+    return (
+        queryset.filter(match)
+        .alias(match_rank=Case(When(prefix, then=0), When(word_prefix, then=1), default=2))
+        .order_by('match_rank', Length(fields[0]), 'id')[:limit]
+    )
+
+
+class IntegerFilter(django_filters.NumberFilter):
+    """
+    NumberFilter that rejects non-integers (400) instead of accepting
+    decimals for integer columns.
+    """
+    field_class = forms.IntegerField
+
+
+class RelationFilter(django_filters.BaseCSVFilter, IntegerFilter):
+    """
+    Filters films by comma-separated related ids with EXISTS subqueries on the
+    through table, so matches never duplicate film rows. `mode` is 'any',
+    'all' or 'none'.
+    """
+    def __init__(self, relation, mode='any', **kwargs):
+        kwargs.setdefault('field_name', relation)
+        super().__init__(**kwargs)
+        self.relation = relation
+        self.mode = mode
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ids = set(value)
+        descriptor = getattr(Film, self.relation)
+        column = f'{descriptor.field.m2m_reverse_field_name()}_id'
+
+        def exists(ids):
+            return Exists(descriptor.through.objects.filter(film_id=OuterRef('pk'), **{f'{column}__in': ids}))
+
+        if self.mode == 'all':
+            for pk in ids:
+                qs = qs.filter(exists([pk]))
+            return qs
+        if self.mode == 'none':
+            return qs.filter(~exists(ids))
+        return qs.filter(exists(ids))
+
+
+class RepeatedCSVWidget(BaseCSVWidget, forms.TextInput):
+    """
+    CSV widget reading every occurrence of the parameter, so `?a=1&a=2` and
+    `?a=1,2` are the same list.
+    """
+    def value_from_datadict(self, data, files, name):
+        if name not in data:
+            return None
+        items = data.getlist(name) if hasattr(data, 'getlist') else [data[name]]
+        return [value for item in items for value in item.split(',') if value]
+
+
+class LegacyRelationFilter(RelationFilter):
+    """
+    RelationFilter for the plain `<relation>` parameters, keeping what the
+    ModelMultipleChoiceFilter they replaced accepted: repeated parameters
+    match any of the ids, and unknown ids are a 400.
+    """
+    def __init__(self, relation, **kwargs):
+        kwargs.setdefault('widget', RepeatedCSVWidget)
+        super().__init__(relation, **kwargs)
+
+    def filter(self, qs, value):
+        if value:
+            ids = set(value)
+            model = getattr(Film, self.relation).field.related_model
+            unknown = ids - set(model._default_manager.filter(pk__in=ids).values_list('pk', flat=True))
+            if unknown:
+                message = forms.ModelMultipleChoiceField.default_error_messages['invalid_choice']
+                raise ValidationError({self.field_name: [message % {'value': min(unknown)}]})
+        return super().filter(qs, value)
+
+
+class FilmFilterSet(django_filters.FilterSet):
+    # `<relation>` and `<relation>__in` match any of the ids, `__all` every
+    # id and `__exclude` none of them. The plain names also take repeated
+    # parameters and reject unknown ids, as they did before the CSV filters
+    genres = LegacyRelationFilter('genres')
+    genres__in = RelationFilter('genres')
+    genres__all = RelationFilter('genres', mode='all')
+    genres__exclude = RelationFilter('genres', mode='none')
+    themes = LegacyRelationFilter('themes')
+    themes__in = RelationFilter('themes')
+    themes__all = RelationFilter('themes', mode='all')
+    themes__exclude = RelationFilter('themes', mode='none')
+    studios = LegacyRelationFilter('studios')
+    studios__in = RelationFilter('studios')
+    studios__all = RelationFilter('studios', mode='all')
+    studios__exclude = RelationFilter('studios', mode='none')
+    countries = LegacyRelationFilter('countries')
+    countries__in = RelationFilter('countries')
+    countries__all = RelationFilter('countries', mode='all')
+    countries__exclude = RelationFilter('countries', mode='none')
+    languages = LegacyRelationFilter('languages')
+    languages__in = RelationFilter('languages')
+    languages__all = RelationFilter('languages', mode='all')
+    languages__exclude = RelationFilter('languages', mode='none')
+
+    class Meta:
+        model = Film
+        filter_overrides = {
+            models.PositiveIntegerField: {'filter_class': IntegerFilter},
+            models.IntegerField: {'filter_class': IntegerFilter},
+        }
+        fields = {
+            'year': ['exact', 'gte', 'lte'],
+            'duration': ['gte', 'lte'],
+            'release_date': ['gte', 'lte'],
+        }
@@ -0,0 +1,130 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median, quantiles
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from films.models import Film
+
+DEFAULT_PATHS = ['films/films/', 'films/genres/', 'films/films/{film}/']
+
+
+def wsgi_get(application, host, url):
+    parts = urlsplit(url)
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query, 'HTTP_HOST': host}
+    setup_testing_defaults(environ)
+    statuses = []
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    try:
+        b''.join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return int(statuses[0].split()[0])
+
+
+async def asgi_get(application, host, url):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'headers': [(b'host', host.encode())],
+        'server': (host, 80),
+        'client': ('127.0.0.1', 0),
+    }
+    messages = []
+    requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # The client never disconnects; Django cancels this wait once it has responded
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return next(m['status'] for m in messages if m['type'] == 'http.response.start')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync views served through config/wsgi.py with the native async views served through "
+        "config/asgi.py. Both applications are driven in-process at the same concurrency, so the numbers "
+        "reflect the Django side only, not a real server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', action='append', dest='paths', metavar='PATH',
+            help="Path under /api/ and /api/async/, '{film}' is replaced by a film id. Repeatable.",
+        )
+        parser.add_argument('--requests', type=int, default=200, help="Requests per path and mode.")
+        parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at once.")
+        parser.add_argument('--host', default='localhost')
+
+    def handle(self, *args, **options):
+        from config.asgi import application as asgi_application
+        from config.wsgi import application as wsgi_application
+
+        film = Film.objects.order_by('pk').values_list('pk', flat=True).first()
+        paths = options['paths'] or DEFAULT_PATHS
+        if film is None and any('{film}' in path for path in paths):
+            raise CommandError("No films to benchmark against, import or seed some first.")
+
+        for path in paths:
+            path = path.format(film=film).lstrip('/')
+            self.stdout.write(f"/{path}")
+            self.report('wsgi', self.run_wsgi(wsgi_application, f'/api/{path}', options))
+            self.report('asgi', self.run_asgi(asgi_application, f'/api/async/{path}', options))
+
+    def run_wsgi(self, application, url, options):
+        def timed(_):
+            started = time.perf_counter()
+            try:
+                return wsgi_get(application, options['host'], url), time.perf_counter() - started
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(timed, range(options['requests'])))
+        return results, time.perf_counter() - started
+
+    def run_asgi(self, application, url, options):
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def timed():
+                async with semaphore:
+                    started = time.perf_counter()
+                    return await asgi_get(application, options['host'], url), time.perf_counter() - started
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*[timed() for _ in range(options['requests'])])
+            return results, time.perf_counter() - started
+
+        return asyncio.run(run())
+
+    def report(self, mode, outcome):
+        results, elapsed = outcome
+        latencies = [latency * 1000 for _, latency in results]
+        errors = sum(1 for status, _ in results if status >= 400)
+        p95 = quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        message = (
+            f"  {mode}: {len(results) / elapsed:8.1f} req/s  "
+            f"p50 {median(latencies):7.1f} ms  p95 {p95:7.1f} ms"
+        )
+        if errors:
+            message += f"  ({errors} errors)"
+        self.stdout.write(self.style.ERROR(message) if errors else message)
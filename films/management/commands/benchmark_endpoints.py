@@ -0,0 +1,317 @@
+import json
+import time
+from pathlib import Path
+from statistics import quantiles
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from films import urls as film_urls
+from films.models import Genre, Theme, Country, Language, Studio, Film, SimilarFilm
+from users import urls as user_urls
+from users.serializers import ClaimsTokenObtainPairSerializer
+
+User = get_user_model()
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+PASSWORD = 'Benchmark-password-1'
+
+
+class Scenario:
+    """
+    One request to time. kwargs and data may be callables of the iteration
+    number, for requests that need a fresh object or payload each time;
+    they're called before the clock starts.
+    """
+    def __init__(self, name, method='get', kwargs=None, query='', data=None, user=None, expect=200, label=None):
+        self.name = name
+        self.method = method
+        self.kwargs = kwargs
+        self.query = query
+        self.data = data
+        self.user = user
+        self.expect = expect
+        self.label = label or f"{method.upper()} {name}" + (f"?{query}" if query else '')
+
+    def prepare(self, i):
+        kwargs = self.kwargs(i) if callable(self.kwargs) else self.kwargs
+        data = self.data(i) if callable(self.data) else self.data
+        url = reverse(self.name, kwargs=kwargs)
+        return (f'{url}?{self.query}' if self.query else url), data
+
+
+def route_names(*modules):
+    return [pattern.name for module in modules for pattern in module.urlpatterns]
+
+
+def percentile(latencies, p):
+    if len(latencies) == 1:
+        return latencies[0]
+    return quantiles(latencies, n=100, method='inclusive')[p - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every route in films/urls.py and users/urls.py through the test client against the current "
+        "database (see generate_dataset), reporting latency percentiles and query counts per request, and "
+        "compare them with a baseline file. Everything runs in one transaction that is rolled back, with a "
+        "private cache, so the data is left as it was. Latencies include the test client's own overhead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Timed requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per scenario before those.")
+        parser.add_argument('--only', metavar='TEXT', help="Only run scenarios whose label contains TEXT.")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline file to compare with or save to.")
+        parser.add_argument('--save-baseline', action='store_true', help="Write the results to the baseline file.")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="Allowed p95 slowdown over the baseline, as a fraction.",
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=2.0,
+            help="p95 slowdowns below this many ms are never regressions, since they're mostly noise.",
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1.")
+        results, meta = self.run(options)
+        baseline_path = Path(options['baseline'])
+
+        baseline = None
+        if not options['save_baseline'] and baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+            if baseline.get('meta', {}).get('dataset') != meta['dataset']:
+                self.stderr.write("The baseline was recorded against a different dataset, compare with care.")
+        regressions = self.report(results, baseline and baseline['results'], options)
+
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({'meta': meta, 'results': results}, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}."))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions: {', '.join(regressions)}")
+
+    def run(self, options):
+        # A private cache, so cached responses and versions bumped by rolled-back writes don't leak
+        private_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark-endpoints',
+        }}
+        private_cache.update({
+            alias: private_cache['default'] for alias in settings.CACHES if alias != 'default'
+        })
+        # Replicas can't see the uncommitted benchmark data, and slow request logs would only repeat the report
+        with override_settings(
+            CACHES=private_cache, DATABASE_REPLICAS=[], SLOW_REQUEST_SAMPLE_RATE=0,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        ), transaction.atomic():
+            meta = {'dataset': self.describe_dataset(), 'requests': options['requests'], 'vendor': connection.vendor}
+            scenarios = self.get_scenarios(self.create_fixtures(options))
+            missing = set(route_names(film_urls, user_urls)) - {scenario.name for scenario in scenarios}
+            if missing:
+                raise CommandError(f"No benchmark scenario for: {', '.join(sorted(missing))}")
+            if options['only']:
+                scenarios = [scenario for scenario in scenarios if options['only'] in scenario.label]
+
+            results, failures = {}, []
+            for scenario in scenarios:
+                result = self.run_scenario(scenario, options)
+                if result.pop('unexpected'):
+                    failures.append(f"{scenario.label} ({', '.join(map(str, result['statuses']))})")
+                results[scenario.label] = result
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(f"Unexpected statuses from: {'; '.join(failures)}")
+        return results, meta
+
+    def describe_dataset(self):
+        return {
+            'films': Film.objects.count(),
+            'users': User.objects.count(),
+            'follows': User.followers.through.objects.count(),
+        }
+
+    def create_fixtures(self, options):
+        films = Film.objects.order_by('id')
+        film = SimilarFilm.objects.order_by('film_id').values_list('film_id', flat=True).first() or (
+            films.values_list('id', flat=True).first()
+        )
+        taxonomy = {
+            model: model.objects.order_by('id').values_list('id', flat=True).first()
+            for model in (Genre, Theme, Country, Language, Studio)
+        }
+        if film is None or None in taxonomy.values():
+            raise CommandError("Nothing to benchmark against, run generate_dataset or import films first.")
+        title = films.filter(id=film).values_list('title', flat=True).get()
+
+        admin = User.objects.create_user('benchmark-admin', password=PASSWORD, role='admin')
+        member = User.objects.create_user('benchmark-member', password=PASSWORD)
+        target = User.objects.create_user('benchmark-target')
+        users = User.objects.exclude(id__in=[admin.pk, member.pk])
+        follow_targets = list(
+            users.order_by('-followers_count', 'id').values_list('id', flat=True)[:options['warmup'] + options['requests']]
+        )
+        return {
+            'film': film,
+            'genre': taxonomy[Genre],
+            'theme': taxonomy[Theme],
+            'country': taxonomy[Country],
+            'language': taxonomy[Language],
+            'studio': taxonomy[Studio],
+            'word': title.split()[0],
+            'admin': admin,
+            'member': member,
+            'target': target.pk,
+            'popular': follow_targets[0],
+            'active': users.order_by('-following_count', 'id').values_list('id', flat=True).first(),
+            'follow_targets': follow_targets,
+        }
+
+    def get_scenarios(self, fx):
+        genre, film, admin, member = fx['genre'], fx['film'], fx['admin'], fx['member']
+        targets = fx['follow_targets']
+
+        def refresh_token(i):
+            return {'refresh': str(ClaimsTokenObtainPairSerializer.get_token(member))}
+
+        def new_genre(i):
+            return {'pk': Genre.objects.create(name=f"Benchmark doomed {i}").pk}
+
+        def new_film(i):
+            return {'pk': Film.objects.create(title=f"Benchmark doomed {i}", year=2000).pk}
+
+        return [
+            # 1. Taxonomy
+            Scenario('genre-list-create'),
+            Scenario('genre-list-create', 'post', data=lambda i: {'name': f"Benchmark genre {i}"}, user=admin, expect=201),
+            Scenario('genre-detail', kwargs={'pk': genre}),
+            Scenario('genre-detail', 'patch', kwargs={'pk': genre}, data=lambda i: {'description': f"Benchmark {i}"}, user=admin),
+            Scenario('genre-detail', 'delete', kwargs=new_genre, user=admin, expect=204),
+            Scenario('theme-list-create'),
+            Scenario('theme-detail', kwargs={'pk': fx['theme']}),
+            Scenario('country-list-create'),
+            Scenario('country-detail', kwargs={'pk': fx['country']}),
+            Scenario('language-list-create'),
+            Scenario('language-detail', kwargs={'pk': fx['language']}),
+            Scenario('studio-list-create'),
+            Scenario('studio-detail', kwargs={'pk': fx['studio']}),
+
+            # 2. Films
+            Scenario('film-list-create'),
+            Scenario('film-list-create', query='ordering=-year'),
+            Scenario('film-list-create', query=f"search={fx['word']}"),
+            Scenario('film-list-create', query=f'genres={genre}'),
+            Scenario('film-list-create', query='expand=genres,studios'),
+            Scenario('film-list-create', query='fields=id,title'),
+            Scenario(
+                'film-list-create', 'post', user=admin, expect=201,
+                data=lambda i: {'title': f"Benchmark film {i}", 'year': 2000, 'genres': [genre]},
+            ),
+            Scenario('film-autocomplete', query=f"q={fx['word'][:3]}"),
+            Scenario('film-facets'),
+            Scenario('film-facets', query=f'genres={genre}'),
+            Scenario(
+                'film-batch', 'post', user=admin,
+                data=lambda i: [{'title': f"Benchmark batch {i}-{n}", 'year': 2000, 'genres': [genre]} for n in range(20)],
+            ),
+            Scenario('film-detail', kwargs={'pk': film}),
+            Scenario('film-detail', 'patch', kwargs={'pk': film}, data=lambda i: {'tagline': f"Benchmark {i}"}, user=admin),
+            Scenario('film-detail', 'delete', kwargs=new_film, user=admin, expect=204),
+            Scenario('film-similar', kwargs={'pk': film}),
+
+            # 3. Accounts
+            Scenario(
+                'register', 'post', expect=201,
+                data=lambda i: {
+                    'username': f'benchmark-new-{i}', 'email': f'benchmark-new-{i}@example.com',
+                    'password': PASSWORD, 'password2': PASSWORD,
+                },
+            ),
+            Scenario('login', 'post', data={'username': member.username, 'password': PASSWORD}),
+            Scenario('admin-login', 'post', data={'username': admin.username, 'password': PASSWORD}),
+            Scenario('token_refresh', 'post', data=refresh_token),
+            Scenario('logout', 'post', data=refresh_token, user=member, expect=205),
+            Scenario('profile', user=member),
+            Scenario('edit-profile', 'patch', data=lambda i: {'bio': f"Benchmark {i}"}, user=member),
+            Scenario(
+                'update-user-role', 'patch', kwargs={'id': fx['target']},
+                data=lambda i: {'role': 'staff' if i % 2 else 'user'}, user=admin,
+            ),
+
+            # 4. Users and follows
+            Scenario('user-list'),
+            Scenario('user-detail', kwargs={'id': fx['popular']}),
+            Scenario('user-list-private', user=admin),
+            Scenario('user-detail-private', kwargs={'id': fx['popular']}, user=admin),
+            Scenario('user-follow', 'post', kwargs=lambda i: {'id': targets[i % len(targets)]}, user=member),
+            Scenario('user-unfollow', 'post', kwargs=lambda i: {'id': targets[i % len(targets)]}, user=member),
+            Scenario(
+                'follow-bulk', 'post', user=member,
+                data=lambda i: {'ids': targets[:100], 'action': 'unfollow' if i % 2 else 'follow'},
+            ),
+            Scenario('user-followers', kwargs={'id': fx['popular']}),
+            Scenario('user-following', kwargs={'id': fx['active']}),
+            Scenario('user-suggestions', kwargs={'id': fx['active']}),
+        ]
+
+    def run_scenario(self, scenario, options):
+        client = Client(raise_request_exception=False)
+        if scenario.user is not None:
+            token = ClaimsTokenObtainPairSerializer.get_token(scenario.user).access_token
+            client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        send = getattr(client, scenario.method)
+
+        latencies, query_counts, statuses = [], [], set()
+        unexpected = False
+        for i in range(options['warmup'] + options['requests']):
+            url, data = scenario.prepare(i)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = send(url, data, content_type='application/json') if data is not None else send(url)
+                elapsed = time.perf_counter() - started
+            statuses.add(response.status_code)
+            unexpected |= response.status_code != scenario.expect
+            if i >= options['warmup']:
+                latencies.append(elapsed * 1000)
+                query_counts.append(len(queries))
+        return {
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'queries': max(query_counts),
+            'statuses': sorted(statuses),
+            'unexpected': unexpected,
+        }
+
+    def report(self, results, baseline, options):
+        """
+        Prints one line per scenario and returns the labels of those slower
+        than the baseline beyond the tolerance or running more queries.
+        """
+        regressions = []
+        width = max(len(label) for label in results) if results else 0
+        self.stdout.write(f"{'':{width}}   p50 ms   p95 ms   p99 ms  queries")
+        for label, result in results.items():
+            line = (
+                f"{label:{width}}  {result['p50_ms']:7.1f}  {result['p95_ms']:7.1f}  "
+                f"{result['p99_ms']:7.1f}  {result['queries']:7d}"
+            )
+            previous = (baseline or {}).get(label)
+            if baseline is not None and previous is None:
+                line += "  (new)"
+            elif previous is not None:
+                slower = result['p95_ms'] - previous['p95_ms']
+                line += f"  p95 {slower:+.1f} ms, queries {result['queries'] - previous['queries']:+d}"
+                if result['queries'] > previous['queries'] or (
+                    slower > previous['p95_ms'] * options['tolerance'] and slower > options['min_delta_ms']
+                ):
+                    regressions.append(label)
+                    self.stdout.write(self.style.ERROR(line))
+                    continue
+            self.stdout.write(line)
+        return regressions
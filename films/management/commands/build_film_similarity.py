@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from films.similarity import rebuild_similar_films
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the precomputed similar films behind /films/<pk>/similar/. By default only the films "
+        "affected by changed relations are recomputed, so it is cheap to run from cron every few minutes; "
+        "schedule an occasional --full run as well to refresh the scores of the films it leaves alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every film.")
+        parser.add_argument('--top-k', type=int, help="Neighbours kept per film (FILM_SIMILARITY_TOP_K).")
+        parser.add_argument(
+            '--block-size', type=int, help="Films scored per matrix block (FILM_SIMILARITY_BLOCK_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = rebuild_similar_films(full=options['full'], k=options['top_k'], block_size=options['block_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Recomputed similar films for {count} films in {elapsed:.1f}s."))
@@ -0,0 +1,285 @@
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from config.snapshot import bump_snapshot_version
+from films.bulk import bulk_set_relations
+from films.models import Genre, Theme, Country, Language, Studio, Film
+from users.models import Follow
+
+User = get_user_model()
+
+SYLLABLES = (
+    'ka', 'ri', 'no', 'mel', 'tor', 'sa', 'vin', 'la', 'dor', 'ex', 'an', 'be', 'lu', 'mar', 'os', 'ten',
+    'gal', 'ir', 'qui', 'ro', 'sel', 'un', 'va', 'zen', 'co', 'dra', 'fi', 'hal', 'jo', 'ny', 'pra', 'wes',
+)
+GENRE_NAMES = (
+    'Drama', 'Comedy', 'Thriller', 'Action', 'Romance', 'Horror', 'Science Fiction', 'Fantasy',
+    'Documentary', 'Animation', 'Crime', 'Adventure', 'Mystery', 'Western', 'Musical', 'War',
+    'History', 'Family', 'Biography', 'Sport', 'Noir', 'Short', 'Experimental', 'Satire',
+)
+STUDIO_SUFFIXES = ('Pictures', 'Films', 'Studios', 'Entertainment', 'Productions', 'Media')
+
+# Fan-out per film: (minimum, Poisson mean on top of it, maximum)
+FAN_OUT = {
+    'genres': (1, 0.8, 4),
+    'themes': (0, 2.0, 8),
+    'studios': (1, 0.4, 3),
+    'countries': (1, 0.3, 4),
+    'languages': (1, 0.4, 4),
+}
+# Zipf exponents: how strongly a few values dominate each relation
+POPULARITY = {'genres': 0.8, 'themes': 1.0, 'studios': 1.1, 'countries': 1.2, 'languages': 1.3}
+# Followers per user and follows per user, so both degree distributions are heavy-tailed
+FOLLOWED_EXPONENT = 1.0
+FOLLOWER_EXPONENT = 0.6
+FOLLOW_SPAN = timedelta(days=3 * 365)
+
+
+def zipf_sampler(rng, n, exponent):
+    """
+    Draws positions in range(n) with probability proportional to
+    1 / rank^exponent, where ranks are a random permutation of the
+    positions, so popularity doesn't follow insertion order.
+    """
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    cdf = np.cumsum(weights[rng.permutation(n)])
+    cdf /= cdf[-1]
+
+    def sample(size):
+        return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), n - 1)
+    return sample
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a seeded synthetic dataset for load tests: taxonomy, films with skewed genre/theme/"
+        "studio/country/language fan-out, users and a power-law follow graph. The same seed and sizes "
+        "produce the same data, given an empty database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--films', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--follows', type=int, default=1_000_000, help="Follow edges, at most users * (users - 1).")
+        parser.add_argument('--genres', type=int, default=len(GENRE_NAMES))
+        parser.add_argument('--themes', type=int, default=300)
+        parser.add_argument('--studios', type=int, default=2000)
+        parser.add_argument('--countries', type=int, default=120)
+        parser.add_argument('--languages', type=int, default=80)
+        parser.add_argument('--user-prefix', default='loaduser', help="Generated usernames are <prefix><number>.")
+        parser.add_argument('--password', default='loadtest-password', help="Password of every generated user.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows written per bulk insert/transaction.")
+
+    def handle(self, *args, **options):
+        if Film.objects.exists() or any(model.objects.exists() for model in (Genre, Theme, Country, Language, Studio)):
+            raise CommandError("Films or taxonomy already exist, generate into an empty database.")
+        if User.objects.filter(username__startswith=options['user_prefix']).exists():
+            raise CommandError(f"Users named {options['user_prefix']}* already exist.")
+        if options['follows'] > options['users'] * max(options['users'] - 1, 0):
+            raise CommandError("More follows requested than there are user pairs.")
+
+        self.rng = np.random.default_rng(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        started = time.monotonic()
+        taxonomy = self.generate_taxonomy(options)
+        self.step("taxonomy", sum(len(ids) for ids in taxonomy.values()), started)
+        self.step("films", self.generate_films(options['films'], taxonomy), started)
+        user_ids = self.generate_users(options['users'], options['user_prefix'], options['password'])
+        self.step("users", len(user_ids), started)
+        self.step("follows", self.generate_follows(user_ids, options['follows']), started)
+        call_command('rebuild_follow_counts', batch_size=self.batch_size, stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated in {time.monotonic() - started:.1f}s. Run build_film_similarity --full next "
+            f"for /similar/; every generated user's password is {options['password']!r}."
+        ))
+
+    def step(self, name, count, started):
+        self.stdout.write(f"{count} {name} ({time.monotonic() - started:.1f}s)")
+
+    # 1. Words
+
+    def words(self, count, syllables=(2, 4)):
+        lengths = self.rng.integers(syllables[0], syllables[1], size=count, endpoint=True)
+        picks = iter(self.rng.integers(len(SYLLABLES), size=int(lengths.sum())).tolist())
+        return [''.join(SYLLABLES[i] for i in islice(picks, n)) for n in lengths.tolist()]
+
+    def phrases(self, count, min_words, max_words):
+        lengths = self.rng.integers(min_words, max_words, size=count, endpoint=True).tolist()
+        words = iter(self.words(sum(lengths)))
+        return [' '.join(islice(words, n)) for n in lengths]
+
+    def unique_names(self, count, make):
+        names = dict.fromkeys(name[:50] for name in make(count))
+        while len(names) < count:
+            names.update(dict.fromkeys(name[:50] for name in make(count - len(names))))
+        return list(names)[:count]
+
+    # 2. Taxonomy
+
+    def generate_taxonomy(self, options):
+        genre_names = list(GENRE_NAMES[:options['genres']])
+        genre_names += [f"Genre {i}" for i in range(len(genre_names), options['genres'])]
+        theme_names = self.unique_names(options['themes'], lambda n: self.phrases(n, 1, 2))
+        studio_names = self.unique_names(
+            options['studios'],
+            lambda n: [
+                f"{word.title()} {STUDIO_SUFFIXES[i]}"
+                for word, i in zip(self.words(n), self.rng.integers(len(STUDIO_SUFFIXES), size=n).tolist())
+            ],
+        )
+        country_names = self.unique_names(options['countries'], lambda n: [w.title() + 'ia' for w in self.words(n)])
+        language_names = self.unique_names(options['languages'], lambda n: [w.title() + 'ish' for w in self.words(n)])
+
+        with transaction.atomic():
+            Genre.objects.bulk_create([Genre(name=name) for name in genre_names])
+            Theme.objects.bulk_create([Theme(name=name.capitalize()) for name in theme_names])
+            Country.objects.bulk_create([
+                Country(name=name, code=f'X{i:03X}') for i, name in enumerate(country_names)
+            ])
+            Language.objects.bulk_create([
+                Language(name=name, code=f'x-{i:03d}') for i, name in enumerate(language_names)
+            ])
+            country_ids = list(Country.objects.order_by('id').values_list('id', flat=True))
+            founded = self.rng.integers(1900, 2020, size=len(studio_names)).tolist()
+            countries = self.rng.integers(len(country_ids), size=len(studio_names)).tolist()
+            Studio.objects.bulk_create([
+                Studio(name=name, founded_year=year, country_id=country_ids[country])
+                for name, year, country in zip(studio_names, founded, countries)
+            ], batch_size=self.batch_size)
+        # bulk_create sends no post_save, which is what bumps these
+        for model in (Genre, Theme, Country, Language, Studio):
+            bump_snapshot_version(model)
+
+        models = {'genres': Genre, 'themes': Theme, 'studios': Studio, 'countries': Country, 'languages': Language}
+        return {
+            field: np.fromiter(model.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+            for field, model in models.items()
+        }
+
+    # 3. Films
+
+    def generate_films(self, count, taxonomy):
+        samplers = {
+            field: zipf_sampler(self.rng, len(ids), POPULARITY[field])
+            for field, ids in taxonomy.items() if len(ids)
+        }
+        created = 0
+        while created < count:
+            size = min(self.batch_size, count - created)
+            films = self.make_films(size)
+            relations = [{} for _ in range(size)]
+            for field, sample in samplers.items():
+                low, mean, high = FAN_OUT[field]
+                fan_out = np.minimum(low + self.rng.poisson(mean, size=size), high)
+                picks = taxonomy[field][sample(int(fan_out.sum()))]
+                for film_relations, ids in zip(relations, np.split(picks, np.cumsum(fan_out)[:-1])):
+                    film_relations[field] = ids.tolist()
+            with transaction.atomic():
+                Film.objects.bulk_create(films)
+                bulk_set_relations(zip(films, relations), batch_size=self.batch_size)
+                Film.objects.filter(pk__in=[film.pk for film in films]).update_search_vector()
+            created += size
+        return created
+
+    def make_films(self, size):
+        rng = self.rng
+        # Recent years dominate, like in any real catalogue
+        years = np.clip(2025 - rng.exponential(18, size=size).astype(int), 1920, 2025).tolist()
+        durations = np.clip(rng.normal(105, 20, size=size), 60, 240).astype(int).tolist()
+        no_duration = (rng.random(size) < 0.05).tolist()
+        release_days = rng.integers(365, size=size).tolist()
+        no_release = (rng.random(size) < 0.1).tolist()
+        has_original = (rng.random(size) < 0.2).tolist()
+        titles = self.phrases(size, 1, 4)
+        originals = self.phrases(size, 1, 4)
+        taglines = self.phrases(size, 3, 8)
+        descriptions = self.phrases(size, 12, 40)
+        return [
+            Film(
+                title=title.title()[:200],
+                original_title=original.title()[:200] if with_original else '',
+                tagline=tagline.capitalize()[:200],
+                year=year,
+                description=description.capitalize() + '.',
+                duration=None if skip_duration else duration,
+                release_date=None if skip_release else date(year, 1, 1) + timedelta(days=day),
+            )
+            for title, original, with_original, tagline, year, description, duration, skip_duration, day, skip_release
+            in zip(
+                titles, originals, has_original, taglines, years, descriptions,
+                durations, no_duration, release_days, no_release,
+            )
+        ]
+
+    # 4. Users and follows
+
+    def generate_users(self, count, prefix, password):
+        # One hash for everyone: hashing per user would dominate the run
+        password = make_password(password)
+        joined = self.now - FOLLOW_SPAN
+        users = (
+            User(username=f'{prefix}{i:07d}', email=f'{prefix}{i:07d}@example.com', password=password, date_joined=joined)
+            for i in range(count)
+        )
+        while True:
+            batch = list(islice(users, self.batch_size))
+            if not batch:
+                break
+            User.objects.bulk_create(batch)
+        return np.fromiter(
+            User.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True),
+            dtype=np.int64,
+        )
+
+    def generate_follows(self, user_ids, count):
+        """
+        Draws (followed, follower) pairs from two Zipf distributions, so a
+        few users have most of the followers and a few follow most, then
+        drops self-follows and duplicates and draws again for the shortfall.
+        """
+        if not count:
+            return 0
+        n = len(user_ids)
+        followed = zipf_sampler(self.rng, n, FOLLOWED_EXPONENT)
+        follower = zipf_sampler(self.rng, n, FOLLOWER_EXPONENT)
+        keys = np.empty(0, dtype=np.int64)
+        for _ in range(50):
+            missing = count - len(keys)
+            if missing <= 0:
+                break
+            draw = int(missing * 1.2) + 16
+            pairs = followed(draw) * n + follower(draw)
+            pairs = pairs[pairs // n != pairs % n]
+            # Keep first occurrences in draw order so the result only depends on the seed
+            merged = np.concatenate([keys, pairs])
+            _, first = np.unique(merged, return_index=True)
+            keys = merged[np.sort(first)]
+        keys = keys[:count]
+        if len(keys) < count:
+            self.stderr.write(f"Only {len(keys)} distinct follows could be drawn.")
+
+        ages = self.rng.random(len(keys)) * FOLLOW_SPAN.total_seconds()
+        created = 0
+        for start in range(0, len(keys), self.batch_size):
+            chunk = keys[start:start + self.batch_size]
+            from_ids = user_ids[chunk // n].tolist()
+            to_ids = user_ids[chunk % n].tolist()
+            seconds = ages[start:start + self.batch_size].tolist()
+            Follow.objects.bulk_create([
+                Follow(from_user_id=from_id, to_user_id=to_id, created_at=self.now - timedelta(seconds=age))
+                for from_id, to_id, age in zip(from_ids, to_ids, seconds)
+            ])
+            created += len(chunk)
+        return created
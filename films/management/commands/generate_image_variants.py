@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from config.images import generate_variants, needs_variants
+from films.models import Country, Film
+
+
+def get_targets():
+    return {
+        'film.poster': (Film, 'poster'),
+        'film.background': (Film, 'background'),
+        'country.flag': (Country, 'flag'),
+        'user.avatar': (get_user_model(), 'avatar'),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate resized WebP variants for existing posters, backgrounds, flags and avatars. "
+        "Rows whose variants are already current are skipped, so an interrupted run can simply be restarted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', metavar='TARGET', help=f"Subset of: {', '.join(get_targets())}.")
+        parser.add_argument('--after-id', type=int, default=0, help="Resume after this primary key.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Rows fetched per query.")
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that are already current.")
+
+    def handle(self, *args, **options):
+        targets = get_targets()
+        selected = options['only'] or list(targets)
+        unknown = set(selected) - set(targets)
+        if unknown:
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+
+        for target in selected:
+            model, field_name = targets[target]
+            done = failed = 0
+            last_id = options['after_id']
+            while True:
+                batch = list(
+                    model.objects.filter(pk__gt=last_id)
+                    .exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                    .order_by('pk')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                for instance in batch:
+                    if options['force'] or needs_variants(instance, field_name):
+                        try:
+                            generate_variants(instance, field_name)
+                            done += 1
+                        except Exception as e:
+                            failed += 1
+                            self.stderr.write(f"{target} {instance.pk}: {e}")
+                last_id = batch[-1].pk
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{target}: up to id {last_id}")
+            self.stdout.write(self.style.SUCCESS(f"{target}: {done} generated, {failed} failed (last id {last_id})."))
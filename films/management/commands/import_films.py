@@ -0,0 +1,188 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from films.bulk import bulk_set_relations
+from films.cache import invalidate_film_details
+from films.models import Genre, Theme, Country, Language, Studio, Film
+
+# Film field name -> related model resolved by name
+RELATIONS = {
+    'genres': Genre,
+    'themes': Theme,
+    'studios': Studio,
+    'countries': Country,
+    'languages': Language,
+}
+SCALAR_FIELDS = [
+    'title', 'original_title', 'tagline', 'year', 'description',
+    'duration', 'trailer_url', 'release_date',
+]
+NULLABLE_FIELDS = {'duration', 'release_date'}
+INTEGER_FIELDS = {'year', 'duration'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream films from a JSON Lines or CSV file and bulk-insert them with their "
+        "genres/themes/studios/countries/languages, resolved by name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import (.jsonl/.ndjson or .csv).")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Films written per bulk_create/transaction.")
+        parser.add_argument('--m2m-batch-size', type=int, default=5000, help="Through-table rows per bulk insert.")
+        parser.add_argument('--separator', default='|', help="Separator for relation names in CSV cells.")
+        parser.add_argument('--upsert', action='store_true', help="Update films that match on (title, year) instead of duplicating them.")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        self.separator = options['separator']
+        self.upsert = options['upsert']
+        self.m2m_batch_size = options['m2m_batch_size']
+        self.lookups = {field: self.load_lookup(model) for field, model in RELATIONS.items()}
+        self.unknown = {field: set() for field in RELATIONS}
+        self.created = self.updated = self.skipped = 0
+
+        started = time.monotonic()
+        with open(options['path'], newline='', encoding='utf-8') as fh:
+            rows = self.read_csv(fh) if fmt == 'csv' else self.read_jsonl(fh)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch)
+                if options['verbosity'] > 1:
+                    self.report(started)
+
+        for field, names in self.unknown.items():
+            if names:
+                self.stderr.write(f"Unknown {field} skipped: {', '.join(sorted(names)[:20])}")
+        self.report(started, style=self.style.SUCCESS)
+
+    def report(self, started, style=None):
+        elapsed = time.monotonic() - started
+        total = self.created + self.updated
+        message = (
+            f"{self.created} created, {self.updated} updated, {self.skipped} skipped "
+            f"in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} films/s)"
+        )
+        self.stdout.write(style(message) if style else message)
+
+    def read_jsonl(self, fh):
+        """
+        Yields (line number, row).
+        """
+        for number, line in enumerate(fh, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    raise CommandError(f"Line {number}: {e}")
+
+    def read_csv(self, fh):
+        """
+        Yields (line number, row), numbering a row by the line it ends on.
+        """
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, row
+
+    def load_lookup(self, model):
+        lookup = {name.casefold(): pk for pk, name in model.objects.values_list('id', 'name')}
+        if model is Country:
+            lookup.update({code.casefold(): pk for pk, code in model.objects.values_list('id', 'code')})
+        return lookup
+
+    def resolve(self, field, value):
+        if isinstance(value, str):
+            value = value.split(self.separator) if value else []
+        ids = []
+        for name in value or []:
+            name = str(name).strip()
+            pk = self.lookups[field].get(name.casefold())
+            if pk is None:
+                self.unknown[field].add(name)
+            elif pk not in ids:
+                ids.append(pk)
+        return ids
+
+    def parse(self, row):
+        """
+        Returns (data, relations) holding only the fields present in row, so
+        an upsert leaves missing columns untouched.
+        """
+        if not isinstance(row, dict):
+            raise TypeError("expected an object")
+        data = {}
+        for field in SCALAR_FIELDS:
+            if field not in row:
+                continue
+            value = row[field]
+            if value in (None, ''):
+                if field in NULLABLE_FIELDS:
+                    data[field] = None
+                    continue
+                if field in INTEGER_FIELDS:
+                    # left to the required fields check below
+                    continue
+                value = ''
+            if field in INTEGER_FIELDS:
+                value = int(value)
+            data[field] = value
+        if not data.get('title') or 'year' not in data:
+            raise ValueError("title and year are required")
+        relations = {field: self.resolve(field, row[field]) for field in RELATIONS if field in row}
+        return data, relations
+
+    def import_batch(self, batch):
+        parsed = {}
+        for number, row in batch:
+            try:
+                data, relations = self.parse(row)
+            except (TypeError, ValueError) as e:
+                self.skipped += 1
+                self.stderr.write(f"Line {number} skipped: {e}")
+                continue
+            # Within a batch the last row for a (title, year) wins when upserting
+            key = (data['title'], data['year']) if self.upsert else number
+            parsed[key] = (data, relations)
+
+        with transaction.atomic():
+            existing = {}
+            if self.upsert and parsed:
+                titles = {title for title, _ in parsed}
+                years = {year for _, year in parsed}
+                for film in Film.objects.filter(title__in=titles, year__in=years):
+                    existing.setdefault((film.title, film.year), film)
+
+            new_films, updated_films, films = [], [], []
+            updated_fields = {'updated_at'}
+            now = timezone.now()
+            for key, (data, relations) in parsed.items():
+                film = existing.get(key)
+                if film is None:
+                    film = Film(**data)
+                    new_films.append(film)
+                else:
+                    for field, value in data.items():
+                        setattr(film, field, value)
+                    film.updated_at = now
+                    updated_fields.update(data)
+                    updated_films.append(film)
+                films.append((film, relations))
+
+            Film.objects.bulk_create(new_films)
+            if updated_films:
+                Film.objects.bulk_update(updated_films, sorted(updated_fields))
+            bulk_set_relations(films, replace={film.pk for film in updated_films}, batch_size=self.m2m_batch_size)
+            Film.objects.filter(pk__in=[film.pk for film, _ in films]).update_search_vector()
+            invalidate_film_details(film.pk for film in updated_films)
+
+        self.created += len(new_films)
+        self.updated += len(updated_films)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def backfill_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Film = apps.get_model('films', 'Film')
+    Film.objects.update(search_vector=(
+        SearchVector('title', 'original_title', weight='A', config='simple')
+        + SearchVector('tagline', weight='B', config='simple')
+        + SearchVector('description', weight='C', config='simple')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0002_film_tagline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='film',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='film_search_vector_idx'),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+# Auto-created through tables can't declare Meta.indexes, so the reverse
+# (related -> film) composite indexes are plain SQL.
+THROUGH_COLUMNS = [
+    ('genres', 'genre_id'),
+    ('themes', 'theme_id'),
+    ('studios', 'studio_id'),
+    ('countries', 'country_id'),
+    ('languages', 'language_id'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['year', 'id'], name='film_year_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['title', 'id'], name='film_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['duration', 'id'], name='film_duration_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(models.OrderBy(models.F('duration'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='film_duration_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['release_date', 'id'], name='film_release_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(models.OrderBy(models.F('release_date'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='film_release_date_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(fields=['updated_at', 'id'], name='film_updated_at_id_idx'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            f'CREATE INDEX film_{relation}_reverse_idx ON films_film_{relation} ({column}, film_id);',
+            f'DROP INDEX film_{relation}_reverse_idx;',
+        )
+        for relation, column in THROUGH_COLUMNS
+    ]
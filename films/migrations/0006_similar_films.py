@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0005_film_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarFilm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='film',
+            name='similarity_stale',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(condition=models.Q(('similarity_stale', True)), fields=['id'], name='film_similarity_stale_idx'),
+        ),
+        migrations.AddField(
+            model_name='similarfilm',
+            name='film',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='films.film'),
+        ),
+        migrations.AddField(
+            model_name='similarfilm',
+            name='similar',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='films.film'),
+        ),
+        migrations.AddIndex(
+            model_name='similarfilm',
+            index=models.Index(fields=['film', '-score'], name='similar_film_score_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarfilm',
+            unique_together={('film', 'similar')},
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:53
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+import films.models
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations, models
+
+# unaccent() is only STABLE (its dictionary could change), so indexes need an
+# IMMUTABLE wrapper that pins the dictionary
+CREATE_UNACCENT = """
+CREATE OR REPLACE FUNCTION kino_unaccent(text) RETURNS text AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+"""
+
+
+def create_unaccent(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_UNACCENT)
+
+
+def drop_unaccent(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP FUNCTION IF EXISTS kino_unaccent(text)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0006_similar_films'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunPython(create_unaccent, drop_unaccent),
+        migrations.AddIndex(
+            model_name='film',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(films.models.ImmutableUnaccent(models.F('title'))), name='gin_trgm_ops'), name='film_title_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(films.models.ImmutableUnaccent(models.F('title'))), name='text_pattern_ops'), name='film_title_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(films.models.ImmutableUnaccent(models.F('original_title'))), name='gin_trgm_ops'), name='film_original_title_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='film',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(films.models.ImmutableUnaccent(models.F('original_title'))), name='text_pattern_ops'), name='film_original_title_prefix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studio',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(films.models.ImmutableUnaccent(models.F('name'))), name='gin_trgm_ops'), name='studio_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studio',
+            index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower(films.models.ImmutableUnaccent(models.F('name'))), name='text_pattern_ops'), name='studio_name_prefix_idx'),
+        ),
+    ]
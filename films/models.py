@@ -1,4 +1,37 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models
+from django.db.models import F, Func
+from django.db.models.functions import Lower
+
+
+class ImmutableUnaccent(Func):
+    """
+    unaccent() through an IMMUTABLE wrapper (created in migration 0007), so
+    it can be used in index expressions.
+    """
+    function = 'kino_unaccent'
+    output_field = models.TextField()
+
+
+def autocomplete_key(expression):
+    """
+    Case- and accent-folded form of expression, as indexed for autocomplete.
+    """
+    return Lower(ImmutableUnaccent(expression))
+
+
+def autocomplete_indexes(prefix, field_name):
+    """
+    A trigram index for substring matches and a pattern_ops B-tree for short
+    prefixes, which trigrams can't serve, over autocomplete_key(field_name).
+    """
+    key = autocomplete_key(F(field_name))
+    return [
+        GinIndex(OpClass(key, name='gin_trgm_ops'), name=f'{prefix}_{field_name}_trgm_idx'),
+        models.Index(OpClass(key, name='text_pattern_ops'), name=f'{prefix}_{field_name}_prefix_idx'),
+    ]
+
 
 # 1. Genre model
 class Genre(models.Model):
@@ -21,6 +54,7 @@ class Country(models.Model):
     name = models.CharField(max_length=60, unique=True)
     code = models.CharField(max_length=4, unique=True)
     flag = models.ImageField(upload_to='flags/', blank=True, null=True)
+    flag_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -40,10 +74,19 @@ class Studio(models.Model):
     founded_year = models.IntegerField(blank=True, null=True)
     country = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = autocomplete_indexes('studio', 'name')
+
     def __str__(self):
         return self.name
     
 # 6. Film model
+class FilmQuerySet(models.QuerySet):
+    def update_search_vector(self):
+        if connection.vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=FILM_SEARCH_VECTOR)
+
 class Film(models.Model):
     title = models.CharField(max_length=200)
     original_title = models.CharField(max_length=200, blank=True)
@@ -53,6 +96,9 @@ class Film(models.Model):
     duration = models.PositiveIntegerField(blank=True, null=True)  # in minutes
     poster = models.ImageField(upload_to='posters/', blank=True, null=True)
     background = models.ImageField(upload_to='backgrounds/', blank=True, null=True)
+    # Resized WebP copies, see config.images
+    poster_variants = models.JSONField(default=dict, blank=True, editable=False)
+    background_variants = models.JSONField(default=dict, blank=True, editable=False)
     trailer_url = models.URLField(blank=True)
     release_date = models.DateField(blank=True, null=True)
 
@@ -65,5 +111,56 @@ class Film(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Weighted full-text document, kept current by update_search_vector()
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Set when the film's relations change, see films.similarity
+    similarity_stale = models.BooleanField(default=True, editable=False)
+
+    objects = FilmQuerySet.as_manager()
+
+    class Meta:
+        # Ordered indexes end with id to match KeysetPagination's tiebreaker.
+        # Nullable columns also get a DESC NULLS LAST twin, since keyset pages
+        # always sort NULLs last.
+        indexes = [
+            GinIndex(fields=['search_vector'], name='film_search_vector_idx'),
+            models.Index(fields=['year', 'id'], name='film_year_id_idx'),
+            models.Index(fields=['title', 'id'], name='film_title_id_idx'),
+            models.Index(fields=['duration', 'id'], name='film_duration_id_idx'),
+            models.Index(F('duration').desc(nulls_last=True), F('id').desc(), name='film_duration_desc_idx'),
+            models.Index(fields=['release_date', 'id'], name='film_release_date_id_idx'),
+            models.Index(F('release_date').desc(nulls_last=True), F('id').desc(), name='film_release_date_desc_idx'),
+            models.Index(fields=['updated_at', 'id'], name='film_updated_at_id_idx'),
+            models.Index(fields=['id'], condition=models.Q(similarity_stale=True), name='film_similarity_stale_idx'),
+            *autocomplete_indexes('film', 'title'),
+            *autocomplete_indexes('film', 'original_title'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.year})"
+
+    def update_search_vector(self):
+        Film.objects.filter(pk=self.pk).update_search_vector()
+
+# 'simple' config: titles and descriptions are multilingual, so no stemming
+FILM_SEARCH_CONFIG = 'simple'
+FILM_SEARCH_VECTOR = (
+    SearchVector('title', 'original_title', weight='A', config=FILM_SEARCH_CONFIG)
+    + SearchVector('tagline', weight='B', config=FILM_SEARCH_CONFIG)
+    + SearchVector('description', weight='C', config=FILM_SEARCH_CONFIG)
+)
+
+# 7. Similar films, precomputed by films.similarity
+class SimilarFilm(models.Model):
+    film = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='similarities')
+    similar = models.ForeignKey(Film, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = [('film', 'similar')]
+        indexes = [
+            models.Index(fields=['film', '-score'], name='similar_film_score_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.title} ({self.year})"
\ No newline at end of file
+        return f"{self.film_id} ~ {self.similar_id} ({self.score:.3f})"
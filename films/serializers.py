@@ -1,32 +1,40 @@
+from django.conf import settings
 from rest_framework import serializers
+from config.images import ImageSrcsetField, ImageVariantField
+from config.serializers import FastListSerializer, SparseFieldsMixin
 from .models import Genre, Theme, Country, Language, Studio, Film
 
 # 1. Genre serializer
-class GenreSerializer(serializers.ModelSerializer):
+class GenreSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Genre
         fields = ['id', 'name', 'description']
+        list_serializer_class = FastListSerializer
 
 # 2. Theme serializer
-class ThemeSerializer(serializers.ModelSerializer):
+class ThemeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Theme
         fields = ['id', 'name', 'description']
+        list_serializer_class = FastListSerializer
 
 # 3. Country serializer
-class CountrySerializer(serializers.ModelSerializer):
+class CountrySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    flag_srcset = ImageSrcsetField('flag')
+
     class Meta:
         model = Country
-        fields = ['id', 'name', 'code', 'flag']
+        fields = ['id', 'name', 'code', 'flag', 'flag_srcset']
 
 # 4. Language serializer
-class LanguageSerializer(serializers.ModelSerializer):
+class LanguageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Language
         fields = ['id', 'name', 'code']
+        list_serializer_class = FastListSerializer
 
 # 5. Studio serializer
-class StudioSerializer(serializers.ModelSerializer):
+class StudioSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     country = CountrySerializer(read_only=True)
     country_id = serializers.PrimaryKeyRelatedField(
         queryset=Country.objects.all(), source='country', write_only=True, required=False
@@ -36,16 +44,36 @@ class StudioSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'founded_year', 'country', 'country_id']
 
 # 6. Film serializers
-class FilmListSerializer(serializers.ModelSerializer):
-    poster = serializers.ImageField(read_only=True)
+class FilmListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Card-sized variant rather than the full-resolution upload
+    poster = ImageVariantField('poster', width=settings.IMAGE_VARIANT_WIDTHS[0])
+    genres = GenreSerializer(many=True, read_only=True)
+    themes = ThemeSerializer(many=True, read_only=True)
+    studios = StudioSerializer(many=True, read_only=True)
+    countries = CountrySerializer(many=True, read_only=True)
+    languages = LanguageSerializer(many=True, read_only=True)
 
     class Meta:
         model = Film
         fields = [
-            'id', 'title', 'year', 'poster'
+            'id', 'title', 'year', 'poster',
+            'genres', 'themes', 'studios', 'countries', 'languages'
         ]
+        # Only rendered with ?expand=
+        expandable_fields = ['genres', 'themes', 'studios', 'countries', 'languages']
+        # Used as long as nothing is expanded
+        list_serializer_class = FastListSerializer
+
+class SimilarFilmSerializer(FilmListSerializer):
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(FilmListSerializer.Meta):
+        fields = FilmListSerializer.Meta.fields + ['similarity']
+
+class FilmDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Bump whenever the output changes so cached documents are not reused
+    cache_version = 2
 
-class FilmDetailSerializer(serializers.ModelSerializer):
     genres = GenreSerializer(many=True, read_only=True)
     themes = ThemeSerializer(many=True, read_only=True)
     studios = StudioSerializer(many=True, read_only=True)
@@ -53,22 +81,44 @@ class FilmDetailSerializer(serializers.ModelSerializer):
     languages = LanguageSerializer(many=True, read_only=True)
     poster = serializers.ImageField(read_only=True)
     background = serializers.ImageField(read_only=True)
+    poster_srcset = ImageSrcsetField('poster')
+    background_srcset = ImageSrcsetField('background')
 
     class Meta:
         model = Film
         fields = [
             'id', 'title', 'original_title', 'tagline', 'year', 
             'description', 'duration', 'poster', 'background', 
+            'poster_srcset', 'background_srcset',
             'trailer_url', 'release_date', 'genres', 'themes', 'studios',
             'countries', 'languages', 'created_at', 'updated_at'
         ]
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves ids from context['preloaded'][model] (a dict of pk -> object)
+    when the caller loaded them up front, e.g. for a batch of films.
+    """
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.queryset.model)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            obj = preloaded.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
 class FilmCreateUpdateSerializer(serializers.ModelSerializer):
-    genres = serializers.PrimaryKeyRelatedField(queryset=Genre.objects.all(), many=True, required=False)
-    themes = serializers.PrimaryKeyRelatedField(queryset=Theme.objects.all(), many=True, required=False)
-    studios = serializers.PrimaryKeyRelatedField(queryset=Studio.objects.all(), many=True, required=False)
-    countries = serializers.PrimaryKeyRelatedField(queryset=Country.objects.all(), many=True, required=False)
-    languages = serializers.PrimaryKeyRelatedField(queryset=Language.objects.all(), many=True, required=False)
+    genres = PreloadedPrimaryKeyRelatedField(queryset=Genre.objects.all(), many=True, required=False)
+    themes = PreloadedPrimaryKeyRelatedField(queryset=Theme.objects.all(), many=True, required=False)
+    studios = PreloadedPrimaryKeyRelatedField(queryset=Studio.objects.all(), many=True, required=False)
+    countries = PreloadedPrimaryKeyRelatedField(queryset=Country.objects.all(), many=True, required=False)
+    languages = PreloadedPrimaryKeyRelatedField(queryset=Language.objects.all(), many=True, required=False)
     poster = serializers.ImageField(required=False)
     background = serializers.ImageField(required=False)
 
@@ -80,3 +130,13 @@ class FilmCreateUpdateSerializer(serializers.ModelSerializer):
             'trailer_url', 'release_date', 'genres', 'themes', 
             'studios', 'countries', 'languages'
         ]
+
+    def create(self, validated_data):
+        film = super().create(validated_data)
+        film.update_search_vector()
+        return film
+
+    def update(self, instance, validated_data):
+        film = super().update(instance, validated_data)
+        film.update_search_vector()
+        return film
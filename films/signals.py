@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from config.images import needs_variants, schedule_variants
+from config.snapshot import bump_snapshot_version
+from .cache import invalidate_film_details
+from .models import Genre, Theme, Country, Language, Studio, Film
+
+RELATION_FIELDS = ('genres', 'themes', 'studios', 'countries', 'languages')
+
+
+def films_referencing(instance):
+    """
+    Ids of films whose detail document embeds instance.
+    """
+    if isinstance(instance, Country):
+        films = Film.objects.filter(countries=instance).values_list('id', flat=True)
+        via_studios = Film.objects.filter(studios__country=instance).values_list('id', flat=True)
+        return set(films) | set(via_studios)
+    return set(instance.film_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Film)
+@receiver(post_delete, sender=Film)
+def invalidate_film(sender, instance, **kwargs):
+    invalidate_film_details([instance.pk])
+
+
+def invalidate_film_relation(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_film_details([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_film_details(pk_set)
+    elif action == 'pre_clear':
+        invalidate_film_details(instance.film_set.values_list('id', flat=True))
+
+
+def mark_similarity_stale(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Film.objects.filter(pk=instance.pk).update(similarity_stale=True)
+    elif action in ('post_add', 'post_remove'):
+        Film.objects.filter(pk__in=pk_set).update(similarity_stale=True)
+    elif action == 'pre_clear':
+        instance.film_set.update(similarity_stale=True)
+
+
+for field_name in RELATION_FIELDS:
+    through = getattr(Film, field_name).through
+    m2m_changed.connect(invalidate_film_relation, sender=through, dispatch_uid=f'films.invalidate_{field_name}')
+    m2m_changed.connect(mark_similarity_stale, sender=through, dispatch_uid=f'films.similarity_{field_name}')
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Theme)
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=Language)
+@receiver(post_save, sender=Studio)
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Theme)
+@receiver(pre_delete, sender=Country)
+@receiver(pre_delete, sender=Language)
+@receiver(pre_delete, sender=Studio)
+def invalidate_related_films(sender, instance, **kwargs):
+    if kwargs.get('created'):
+        return
+    invalidate_film_details(films_referencing(instance))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Theme)
+@receiver(pre_delete, sender=Country)
+@receiver(pre_delete, sender=Language)
+@receiver(pre_delete, sender=Studio)
+def mark_related_films_stale(sender, instance, **kwargs):
+    # The through rows are cascaded without m2m_changed
+    instance.film_set.update(similarity_stale=True)
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Theme)
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=Language)
+@receiver(post_save, sender=Studio)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Theme)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=Language)
+@receiver(post_delete, sender=Studio)
+def invalidate_taxonomy_snapshot(sender, instance, **kwargs):
+    # After commit, or another worker could reload the old rows under the new version
+    transaction.on_commit(lambda: bump_snapshot_version(sender))
+    if sender is Country:
+        # Studios embed their country
+        transaction.on_commit(lambda: bump_snapshot_version(Studio))
+
+
+@receiver(post_save, sender=Film)
+@receiver(post_save, sender=Country)
+def schedule_image_variants(sender, instance, **kwargs):
+    for field_name in ('poster', 'background') if sender is Film else ('flag',):
+        if needs_variants(instance, field_name):
+            schedule_variants(instance, field_name)
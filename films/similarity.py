@@ -0,0 +1,145 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+from .bulk import RELATION_FIELDS
+from .models import Film, SimilarFilm
+
+# How much a shared value of each relation counts towards similarity
+FEATURE_WEIGHTS = {
+    'genres': 3.0,
+    'themes': 2.0,
+    'studios': 1.5,
+    'countries': 1.0,
+    'languages': 0.5,
+}
+
+
+def build_feature_matrix():
+    """
+    Returns (film_ids, X): the sorted film ids and a CSR matrix with one
+    L2-normalised row per film and one column per genre/theme/studio/
+    country/language. Entries are the relation weight times the value's
+    IDF, so rare shared values count for more than ubiquitous ones, and
+    X @ X.T gives cosine similarities.
+    """
+    film_ids = np.fromiter(Film.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    rows, cols, values = [], [], []
+    offset = 0
+    for field in RELATION_FIELDS:
+        descriptor = getattr(Film, field)
+        target = descriptor.field.m2m_reverse_field_name()
+        pairs = np.array(
+            list(descriptor.through.objects.values_list('film_id', f'{target}_id')), dtype=np.int64
+        ).reshape(-1, 2)
+        # Skip rows of films created since film_ids was read
+        pairs = pairs[np.isin(pairs[:, 0], film_ids)]
+        row = np.searchsorted(film_ids, pairs[:, 0])
+        values_ids, col, df = np.unique(pairs[:, 1], return_inverse=True, return_counts=True)
+        idf = np.log1p(len(film_ids) / df)
+        rows.append(row)
+        cols.append(col + offset)
+        values.append(FEATURE_WEIGHTS[field] * idf[col])
+        offset += len(values_ids)
+
+    X = sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(film_ids), offset), dtype=np.float32,
+    )
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return film_ids, sparse.diags(1 / norms).astype(np.float32) @ X
+
+
+def top_neighbours(X, rows, k):
+    """
+    For the films at positions rows, returns (neighbours, scores): k
+    positions and cosine scores per row, best first. Films with nothing in
+    common score 0.
+    """
+    block = (X[rows] @ X.T).toarray()
+    block[np.arange(len(rows)), rows] = -1  # never a neighbour of itself
+    k = min(k, X.shape[0] - 1)
+    if k <= 0:
+        return np.empty((len(rows), 0), dtype=np.int64), np.empty((len(rows), 0), dtype=np.float32)
+    neighbours = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(block, neighbours, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(neighbours, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def affected_rows(X, film_ids, stale, k, block_size):
+    """
+    Positions of the films whose neighbour lists may change because the
+    films at positions stale changed: the stale films themselves, films
+    currently listing one of them, and films a stale film would now make
+    it into the top k of.
+    """
+    listing = SimilarFilm.objects.filter(similar_id__in=film_ids[stale].tolist()).values_list('film_id', flat=True)
+    affected = np.isin(film_ids, list(listing))
+    affected[stale] = True
+
+    # Score a newcomer has to beat, 0 for films with fewer than k neighbours
+    thresholds = np.zeros(len(film_ids), dtype=np.float32)
+    full = np.array(list(
+        SimilarFilm.objects.values('film_id').annotate(n=Count('id'), low=Min('score'))
+        .filter(n__gte=k).values_list('film_id', 'low')
+    )).reshape(-1, 2)
+    present = np.isin(full[:, 0].astype(np.int64), film_ids)
+    thresholds[np.searchsorted(film_ids, full[present, 0].astype(np.int64))] = full[present, 1]
+
+    for start in range(0, len(stale), block_size):
+        columns = X[stale[start:start + block_size]].T
+        best = np.asarray((X @ columns).max(axis=1).todense()).ravel()
+        affected |= best > thresholds
+    return np.flatnonzero(affected)
+
+
+def rebuild_similar_films(full=False, k=None, block_size=None):
+    """
+    Recomputes the top-k similar films. Incrementally, only the films
+    affected by stale films are recomputed; full=True (or too many stale
+    films for an incremental pass to pay off) recomputes every film. A
+    change also shifts the IDF weights, so scores of films left untouched
+    drift slightly until the next full pass.
+    Returns the number of films whose neighbour lists were rewritten.
+    """
+    k = k or settings.FILM_SIMILARITY_TOP_K
+    block_size = block_size or settings.FILM_SIMILARITY_BLOCK_SIZE
+    stale_ids = list(Film.objects.filter(similarity_stale=True).values_list('id', flat=True))
+    if not full and not stale_ids:
+        return 0
+    # Cleared up front so films changed while this runs are picked up next time
+    Film.objects.filter(id__in=stale_ids).update(similarity_stale=False)
+    try:
+        return _rebuild(full, stale_ids, k, block_size)
+    except BaseException:
+        Film.objects.filter(id__in=stale_ids).update(similarity_stale=True)
+        raise
+
+
+def _rebuild(full, stale_ids, k, block_size):
+    film_ids, X = build_feature_matrix()
+    if not len(film_ids):
+        return 0
+    stale = np.flatnonzero(np.isin(film_ids, stale_ids))
+    if full or len(stale) > len(film_ids) // 10:
+        rows = np.arange(len(film_ids))
+    else:
+        rows = affected_rows(X, film_ids, stale, k, block_size)
+
+    ids = film_ids.tolist()
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        neighbours, scores = top_neighbours(X, block, k)
+        similar = [
+            SimilarFilm(film_id=ids[row], similar_id=ids[neighbour], score=score)
+            for row, row_neighbours, row_scores in zip(block.tolist(), neighbours.tolist(), scores.tolist())
+            for neighbour, score in zip(row_neighbours, row_scores)
+            if score > 0
+        ]
+        with transaction.atomic():
+            SimilarFilm.objects.filter(film_id__in=film_ids[block].tolist()).delete()
+            SimilarFilm.objects.bulk_create(similar)
+    return len(rows)
@@ -1,3 +1,947 @@
-from django.test import TestCase
+import json
+import tempfile
+import time
+from base64 import urlsafe_b64encode
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIClient
+from config.pagination import KeysetPagination
+from config.renderers import FastJSONRenderer
+from . import urls as film_urls
+from users import urls as user_urls
+from .cache import get_film_detail, get_film_generation
+from .models import Genre, Country, Language, Studio, Film, SimilarFilm
+from .serializers import FilmDetailSerializer, FilmListSerializer, GenreSerializer, LanguageSerializer
+from .similarity import rebuild_similar_films
+from .views import FilmListCreateView
+
+
+@skipUnless(connection.vendor == 'postgresql', "Query plan checks need PostgreSQL")
+@override_settings(DATABASE_REPLICAS=[])  # replicas can't see the test transaction
+class FilmQueryPlanTests(TestCase):
+    """
+    EXPLAINs the SQL behind every supported filter/order combination of the
+    film list and fails on sequential scans. Seq scans are disabled for the
+    test transaction, so a Seq Scan in a plan means no index can serve the
+    query at all, whatever the table size.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        genres = Genre.objects.bulk_create([Genre(name=f"Genre {i}") for i in range(20)])
+        films = Film.objects.bulk_create([
+            Film(
+                title=f"Film {i:05d}",
+                year=1950 + i % 70,
+                duration=None if i % 10 == 0 else 80 + i % 90,
+                release_date=None if i % 7 == 0 else date(1950, 1, 1) + timedelta(days=i * 13),
+            )
+            for i in range(2000)
+        ])
+        Film.genres.through.objects.bulk_create([
+            Film.genres.through(film_id=film.pk, genre_id=genres[(i + offset) % len(genres)].pk)
+            for i, film in enumerate(films)
+            for offset in (0, 7)
+        ])
+        cls.genre = genres[0]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE films_film')
+            cursor.execute('ANALYZE films_film_genres')
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def explain(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, sql, params=None, ordered=False):
+        plan = self.explain(sql, params)
+        self.assertNotIn('Seq Scan', plan, f"\n{sql}\n{plan}")
+        if ordered:
+            self.assertNotIn('Sort', plan, f"\n{sql}\n{plan}")
+
+    def film_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        queries = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and '"films_film"' in q['sql']]
+        return response.json(), queries
+
+    def test_film_list_filter_and_order_combinations(self):
+        orderings = [prefix + field for field in FilmListCreateView.ordering_fields for prefix in ('', '-')]
+        filters = ['', f'year=1990&', f'genres={self.genre.pk}&']
+        for query in filters:
+            for ordering in orderings:
+                with self.subTest(filter=query, ordering=ordering):
+                    url = f"{reverse('film-list-create')}?{query}ordering={ordering}"
+                    data, queries = self.film_queries(url)
+                    # Second page exercises the keyset condition as well
+                    _, next_queries = self.film_queries(data['next'])
+                    for sql in queries + next_queries:
+                        self.assertUsesIndex(sql, ordered=not query)
+
+    def test_release_date_and_updated_at_orderings(self):
+        querysets = [
+            Film.objects.order_by('release_date', 'id'),
+            Film.objects.order_by(F('release_date').desc(nulls_last=True), '-id'),
+            Film.objects.order_by('updated_at', 'id'),
+            Film.objects.order_by('-updated_at', '-id'),
+        ]
+        for queryset in querysets:
+            with self.subTest(ordering=queryset.query.order_by):
+                self.assertUsesIndex(*queryset[:20].query.sql_with_params(), ordered=True)
+
+    def test_reverse_relation_lookup(self):
+        queryset = Film.genres.through.objects.filter(genre=self.genre).values('film_id')
+        self.assertUsesIndex(*queryset.query.sql_with_params())
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class EagerLoadingTests(TestCase):
+    """
+    List and detail endpoints run the same number of queries however many
+    rows and related rows they render.
+    """
+    def add_films(self, count):
+        suffix = Film.objects.count()
+        country = Country.objects.create(name=f"Country {suffix}", code=f"C{suffix}")
+        language = Language.objects.create(name=f"Language {suffix}", code=f"L{suffix}")
+        for i in range(count):
+            film = Film.objects.create(title=f"Film {suffix + i}", year=2000)
+            genre = Genre.objects.create(name=f"Genre {suffix + i}")
+            # each studio embeds its country
+            studio = Studio.objects.create(name=f"Studio {suffix + i}", founded_year=1900, country=country)
+            film.genres.add(genre, *Genre.objects.all()[:2])
+            film.studios.add(studio, *Studio.objects.all()[:2])
+            film.countries.add(country)
+            film.languages.add(language)
+        return film
+
+    def assertSteadyQueries(self, num, url):
+        for count in (1, 5, 20):
+            with self.subTest(films=Film.objects.count() + count):
+                self.add_films(count)
+                cache.clear()
+                path = url() if callable(url) else url
+                with self.assertNumQueries(num):
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_film_list(self):
+        self.assertSteadyQueries(1, reverse('film-list-create'))  # rendered from .values() rows
+
+    def test_expanded_film_list(self):
+        # page, genres, studios and the studios' countries
+        self.assertSteadyQueries(4, f"{reverse('film-list-create')}?expand=genres,studios")
+
+    def test_film_detail(self):
+        # film, one per relation and the studios' countries
+        self.assertSteadyQueries(7, lambda: reverse('film-detail', args=[Film.objects.latest('id').pk]))
+
+    def test_studio_list(self):
+        self.assertSteadyQueries(1, reverse('studio-list-create'))  # with their countries
+        with self.assertNumQueries(0):  # served from the snapshot
+            self.client.get(reverse('studio-list-create'))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FastSerializationTests(TestCase):
+    """
+    The FastListSerializer path and FastJSONRenderer must produce exactly
+    the bytes the regular serializers and JSONRenderer produce.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        Genre.objects.bulk_create([
+            Genre(name="Drama", description="Ünïcödé, \"quotes\" and a line\u2028separator"),
+            Genre(name="Film noir", description=""),
+            Genre(name="Sci-fi \U0001F680", description="<b>&amp;</b>"),
+        ])
+        Language.objects.bulk_create([Language(name="Français", code="fr"), Language(name="日本語", code="ja")])
+        Film.objects.bulk_create([
+            Film(title="Amélie", year=2001, poster='posters/amelie.jpg', poster_variants={
+                'source': 'posters/amelie.jpg',
+                'sizes': {'200': 'posters/variants/amelie_w200.webp', '400': 'posters/variants/amelie_w400.webp'},
+            }),
+            # Variants of a previous upload are ignored
+            Film(title="Stale", year=1999, poster='posters/new.jpg', poster_variants={
+                'source': 'posters/old.jpg', 'sizes': {'200': 'posters/variants/old_w200.webp'},
+            }),
+            Film(title="No poster", year=2020),
+            *[Film(title=f"Film {i}", year=1950 + i) for i in range(30)],
+        ])
+
+    def reference(self, serializer_class, rows, request):
+        context = {'request': Request(request)}
+        return ListSerializer(rows, child=serializer_class(context=context), context=context).data
+
+    def test_serializers_match_regular_path(self):
+        request = RequestFactory().get('/')
+        cases = [
+            (GenreSerializer, Genre.objects.order_by('id'), ['id', 'name', 'description']),
+            (LanguageSerializer, Language.objects.order_by('id'), ['id', 'name', 'code']),
+            (FilmListSerializer, Film.objects.order_by('id'), ['id', 'title', 'year', 'poster', 'poster_variants']),
+        ]
+        for serializer_class, queryset, columns in cases:
+            expected = JSONRenderer().render(self.reference(serializer_class, list(queryset), request))
+            for rows in (list(queryset), list(queryset.values(*columns))):
+                with self.subTest(serializer=serializer_class.__name__, rows=type(rows[0]).__name__):
+                    data = serializer_class(rows, many=True, context={'request': Request(request)}).data
+                    self.assertEqual(JSONRenderer().render(data), expected)
+                    self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_list_responses_match_regular_path(self):
+        urls = [
+            (reverse('genre-list-create'), GenreSerializer, Genre.objects.order_by('id')),
+            (reverse('language-list-create'), LanguageSerializer, Language.objects.order_by('id')),
+            (reverse('film-list-create'), FilmListSerializer, Film.objects.order_by('id')[:20]),
+        ]
+        for url, serializer_class, queryset in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                expected = {
+                    'next': response.json()['next'],
+                    'previous': None,
+                    'results': self.reference(serializer_class, list(queryset), response.wsgi_request),
+                }
+                self.assertEqual(response.content, JSONRenderer().render(expected))
+
+    def test_renderer_matches_json_renderer(self):
+        values = [
+            {'a': [1, 2.5, 0.1, -0, True, None], 'b': {'nested': "é\u2028\u2029\x1f"}},
+            {'small': 1e-05, 'large': 1e16, 'text': "1e5"},
+            {'huge': 2 ** 70, 1: date(2020, 1, 2)},
+            [],
+        ]
+        for value in values:
+            with self.subTest(value=value):
+                self.assertEqual(FastJSONRenderer().render(value), JSONRenderer().render(value))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.film = Film.objects.create(title="Both", year=1990)
+        cls.film.genres.set([Genre.objects.create(name="Drama")])
+
+    def setUp(self):
+        cache.clear()
+
+    def server_timing(self, response):
+        """
+        {metric: (duration in ms, description)} from the Server-Timing header.
+        """
+        timings = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            params = dict(param.split('=', 1) for param in params)
+            timings[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+        return timings
+
+    def test_server_timing(self):
+        for name in ('film-list-create', 'film-list-async'):
+            with self.subTest(name=name), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+                timings = self.server_timing(response)
+                self.assertEqual(list(timings), ['db', 'serialize', 'render', 'total'])
+                self.assertEqual(timings['db'][1], f"{len(queries)} queries")
+                self.assertLessEqual(timings['serialize'][0] + timings['render'][0], timings['total'][0])
+
+    def test_serialization_is_timed_apart_from_rendering(self):
+        to_representation = FilmDetailSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.05)
+            return to_representation(serializer, instance)
+
+        with mock.patch.object(FilmDetailSerializer, 'to_representation', slow):
+            for name in ('film-detail', 'film-detail-async'):
+                with self.subTest(name=name):
+                    cache.clear()
+                    timings = self.server_timing(self.client.get(reverse(name, args=[self.film.pk])))
+                    self.assertGreaterEqual(timings['serialize'][0], 50)
+                    self.assertLess(timings['render'][0], 50)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('film-list-create'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)  # no token and DEBUG off
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        labels = 'route="film-list-create",method="GET"'
+        for metric in (
+            'kino_request_duration_seconds', 'kino_db_duration_seconds', 'kino_db_queries',
+            'kino_serialize_duration_seconds', 'kino_render_duration_seconds', 'kino_response_size_bytes',
+        ):
+            with self.subTest(metric=metric):
+                self.assertIn(f'# TYPE {metric} histogram', body)
+                self.assertIn(f'{metric}_bucket{{{labels},le="+Inf"}}', body)
+                self.assertIn(f'{metric}_count{{{labels}}}', body)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class BenchmarkSuiteTests(TestCase):
+    """
+    Runs the endpoint benchmark once per route on a small generated dataset,
+    so a new route without a scenario or a scenario that stopped getting
+    its expected status fails here rather than in the next load test.
+    """
+    def test_every_route_benchmarks_and_rolls_back(self):
+        call_command(
+            'generate_dataset', seed=1, films=50, users=30, follows=200,
+            themes=10, studios=10, countries=5, languages=5, stdout=StringIO(),
+        )
+        films = Film.objects.count()
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            call_command(
+                'benchmark_endpoints', requests=1, warmup=0, baseline=str(baseline), save_baseline=True,
+                stdout=StringIO(),
+            )
+            results = json.loads(baseline.read_text())['results']
+
+        names = {label.split()[1].split('?')[0] for label in results}
+        self.assertEqual(names, {p.name for p in film_urls.urlpatterns + user_urls.urlpatterns})
+        self.assertEqual(Film.objects.count(), films)
+        self.assertFalse(Genre.objects.filter(name__startswith="Benchmark").exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', "Full-text search needs PostgreSQL")
+@override_settings(DATABASE_REPLICAS=[])
+class FilmSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Repeats of the term spread the ranks, and identical films tie
+        Film.objects.bulk_create([
+            Film(title=f"Harbour {i % 7}", year=2000, description=' '.join(['harbour'] * (i % 5)) + f" night {i}")
+            for i in range(55)
+        ])
+        Film.objects.update_search_vector()
+
+    def test_ranked_pages_cover_every_match_once(self):
+        url, ids = reverse('film-list-create') + '?search=harbour', []
+        while url:
+            data = self.client.get(url).json()
+            ids += [film['id'] for film in data['results']]
+            url = data['next']
+        self.assertEqual(sorted(ids), sorted(Film.objects.values_list('id', flat=True)))
+        self.assertEqual(len(ids), len(set(ids)))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class TaxonomySnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.france = Country.objects.create(name="France", code="FR")
+        Studio.objects.create(name="Gaumont", founded_year=1895, country=cls.france)
+        Studio.objects.create(name="Toho", founded_year=1932)
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['name'] for row in response.json()['results']]
+
+    def test_filters_match_the_database_backend(self):
+        for async_ in (False, True):
+            url = reverse('studio-list-async' if async_ else 'studio-list-create')
+            with self.subTest(async_=async_):
+                self.assertEqual(self.names(f'{url}?founded_year=1895'), ["Gaumont"])
+                self.assertEqual(self.names(f'{url}?country={self.france.pk}'), ["Gaumont"])
+                self.assertEqual(self.names(f'{url}?name=Toho&ordering=-name'), ["Toho"])
+                self.assertEqual(self.names(f'{url}?founded_year=1895.5'), [])
+                for query in ('founded_year=abc', 'country=999999'):
+                    self.assertEqual(self.client.get(f'{url}?{query}').status_code, 400, query)
+
+
+    def test_writes_reach_the_snapshot_on_commit(self):
+        url = reverse('genre-list-create')
+        self.assertEqual(self.names(url), [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            genre = Genre.objects.create(name="Drama")
+            self.assertEqual(self.names(url), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.names(url), ["Drama"])
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.delete()
+        self.assertEqual(self.names(url), [])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FilmBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama = Genre.objects.create(name="Drama")
+        cls.comedy = Genre.objects.create(name="Comedy")
+        cls.film = Film.objects.create(title="Old Title", year=1990)
+        cls.film.genres.add(cls.drama)
+        cls.admin = get_user_model().objects.create(username="admin", role='admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, items):
+        return self.client.post(reverse('film-batch'), items, format='json')
+
+    def test_creates_and_updates(self):
+        response = self.post([
+            {'title': "New Film", 'year': 2020, 'genres': [self.drama.pk, self.comedy.pk]},
+            {'id': self.film.pk, 'title': "New Title", 'genres': [self.comedy.pk]},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        created, updated = response.json()['results']
+        self.assertEqual(created['status'], 'created')
+        self.assertEqual(updated, {'id': self.film.pk, 'status': 'updated'})
+
+        new_film = Film.objects.get(pk=created['id'])
+        self.assertEqual((new_film.title, new_film.year), ("New Film", 2020))
+        self.assertCountEqual(new_film.genres.all(), [self.drama, self.comedy])
+        self.film.refresh_from_db()
+        self.assertEqual((self.film.title, self.film.year), ("New Title", 1990))  # partial update
+        self.assertCountEqual(self.film.genres.all(), [self.comedy])
+
+    def test_one_invalid_item_writes_nothing(self):
+        response = self.post([
+            {'title': "Fine", 'year': 2020},
+            {'title': "No Year"},
+            {'id': 0, 'title': "Missing"},
+            {'id': self.film.pk, 'genres': [999999]},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('year', errors[1])
+        self.assertEqual(errors[2], {'id': ["Film not found."]})
+        self.assertIn('genres', errors[3])
+        self.assertFalse(Film.objects.filter(title="Fine").exists())
+        self.assertCountEqual(self.film.genres.all(), [self.drama])
+
+    def test_rejects_bad_payloads(self):
+        for payload in ({'title': "Not a list"}, [], ["not an object"], [{'year': 2000}] * 501):
+            with self.subTest(payload=str(payload)[:40]):
+                self.assertEqual(self.post(payload).status_code, 400)
+        duplicate = self.post([{'id': self.film.pk, 'year': 1991}, {'id': self.film.pk, 'year': 1992}])
+        self.assertEqual(duplicate.json()['errors'][1], {'id': ["Duplicate id in batch."]})
+
+    def test_requires_admin_or_staff(self):
+        self.client.force_authenticate(get_user_model().objects.create(username="viewer"))
+        self.assertEqual(self.post([{'title': "Nope", 'year': 2000}]).status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.post([{'title': "Nope", 'year': 2000}]).status_code, 401)
+        self.assertFalse(Film.objects.filter(title="Nope").exists())
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FilmFacetsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name="Drama"), Genre(name="Comedy")])
+        cls.studio = Studio.objects.create(name="Ealing")
+        cls.both = Film.objects.create(title="Both", year=1990)
+        cls.drama_only = Film.objects.create(title="Drama only", year=1995)
+        cls.neither = Film.objects.create(title="Neither", year=2003)
+        cls.both.genres.set([cls.drama, cls.comedy])
+        cls.drama_only.genres.set([cls.drama])
+        cls.both.studios.set([cls.studio])
+
+    def facets(self, query=''):
+        response = self.client.get(f"{reverse('film-facets')}?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_counts(self):
+        with self.assertNumQueries(7):  # total, one per relation, decades
+            data = self.facets()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['genres'], [
+            {'id': self.drama.pk, 'name': "Drama", 'count': 2},
+            {'id': self.comedy.pk, 'name': "Comedy", 'count': 1},
+        ])
+        self.assertEqual(data['studios'], [{'id': self.studio.pk, 'name': "Ealing", 'count': 1}])
+        self.assertEqual((data['themes'], data['countries'], data['languages']), ([], [], []))
+        self.assertEqual(data['years'], [{'decade': 1990, 'count': 2}, {'decade': 2000, 'count': 1}])
+
+    def test_counts_follow_the_list_filters(self):
+        data = self.facets('year=1995')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['genres'], [{'id': self.drama.pk, 'name': "Drama", 'count': 1}])
+        self.assertEqual(data['studios'], [])
+        self.assertEqual(data['years'], [{'decade': 1990, 'count': 1}])
+        self.assertEqual(self.client.get(f"{reverse('film-facets')}?year=abc").status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FilmFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name="Drama"), Genre(name="Comedy")])
+        cls.both = Film.objects.create(title="Both", year=1990, duration=100)
+        cls.drama_only = Film.objects.create(title="Drama only", year=1995, duration=130)
+        cls.neither = Film.objects.create(title="Neither", year=2000)
+        cls.both.genres.set([cls.drama, cls.comedy])
+        cls.drama_only.genres.set([cls.drama])
+
+    def titles(self, query):
+        response = self.client.get(f"{reverse('film-list-create')}?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [film['title'] for film in response.json()['results']]
+
+    def test_ranges_and_relations(self):
+        drama, comedy = self.drama.pk, self.comedy.pk
+        self.assertEqual(self.titles('year=1990'), ["Both"])
+        self.assertEqual(self.titles('year=1990.0'), ["Both"])
+        self.assertEqual(self.titles('year__gte=1991&year__lte=2000'), ["Drama only", "Neither"])
+        self.assertEqual(self.titles('duration__gte=120'), ["Drama only"])
+        self.assertEqual(self.titles(f'genres={drama},{comedy}'), ["Both", "Drama only"])
+        self.assertEqual(self.titles(f'genres__all={drama},{comedy}'), ["Both"])
+        self.assertEqual(self.titles(f'genres__exclude={comedy}'), ["Drama only", "Neither"])
+
+    def test_legacy_relation_parameters(self):
+        # As with the ModelMultipleChoiceFilter the plain names replaced
+        drama, comedy = self.drama.pk, self.comedy.pk
+        self.assertEqual(self.titles(f'genres={drama}&genres={comedy}'), ["Both", "Drama only"])
+        self.assertEqual(self.titles(f'genres={comedy}&genres={drama},{comedy}'), ["Both", "Drama only"])
+        response = self.client.get(f"{reverse('film-list-create')}?genres={drama}&genres=0")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'genres': ["Select a valid choice. 0 is not one of the available choices."]})
+        self.assertEqual(self.client.get(f"{reverse('film-facets')}?studios=0").status_code, 400)
+        # the new names don't look the ids up
+        self.assertEqual(self.titles('genres__in=0'), [])
+
+    def test_non_integers_are_rejected(self):
+        for query in ('year=1990.7', 'duration__gte=1.5', 'year=abc', f'genres={self.drama.pk},2.5'):
+            with self.subTest(query=query):
+                response = self.client.get(f"{reverse('film-list-create')}?{query}")
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+@mock.patch.object(KeysetPagination, 'page_size', 4)
+class FilmKeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Ties on every column, and a NULL duration on every fourth film
+        Film.objects.bulk_create([
+            Film(title=f"Film {i % 4}", year=2000 + i % 3, duration=None if i % 4 == 0 else 90 + i % 5)
+            for i in range(23)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_ids(self, ordering):
+        """
+        Film ids in keyset order: id as the tiebreaker in the direction of the
+        first column, NULLs last either way.
+        """
+        name = ordering.lstrip('-')
+        desc = ordering.startswith('-')
+        rows = Film.objects.values_list(name, 'id')
+        ordered = sorted([row for row in rows if row[0] is not None], reverse=desc)
+        ordered += sorted([row for row in rows if row[0] is None], key=lambda row: row[1], reverse=desc)
+        return [film_id for _, film_id in ordered]
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            pages.append([film['id'] for film in data['results']])
+            url = data[link]
+        return pages, data
+
+    def test_every_ordering_pages_through_once(self):
+        for name in FilmListCreateView.ordering_fields:
+            for ordering in (name, f'-{name}'):
+                with self.subTest(ordering=ordering):
+                    pages, last = self.walk(f"{reverse('film-list-create')}?ordering={ordering}", 'next')
+                    self.assertEqual(sum(pages, []), self.expected_ids(ordering))
+                    self.assertNotIn('count', last)
+                    # and back again from the last page
+                    back, _ = self.walk(last['previous'], 'previous')
+                    self.assertEqual(back, pages[-2::-1])
+
+    def test_page_numbers_opt_in(self):
+        # Page numbers keep the settings' page size
+        response = self.client.get(f"{reverse('film-list-create')}?page=2")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 23)
+        self.assertEqual([film['id'] for film in data['results']], self.expected_ids('id')[20:])
+        self.assertIsNone(data['next'])
+        self.assertNotIn('cursor=', data['previous'])
+
+    def test_count_opt_in(self):
+        data = self.client.get(f"{reverse('film-list-create')}?count=1").json()
+        self.assertEqual(data['count'], 23)
+        self.assertNotIn('page=', data['next'])
+
+    def test_bad_cursors_are_rejected(self):
+        url = reverse('film-list-create')
+        next_link = self.client.get(f'{url}?ordering=title').json()['next']
+        encode = lambda payload: urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        for query in (
+            'cursor=garbage',
+            f'cursor={encode([1, 2])}',
+            f'cursor={encode({"o": [["id", False]], "p": [1, 2], "r": False})}',
+            f'cursor={encode({"o": [["id", False]], "p": ["abc"], "r": False})}',
+            next_link.split('?')[1].replace('ordering=title', 'ordering=year'),  # taken under another ordering
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f'{url}?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'cursor': ['Invalid cursor']})
+
+
+@override_settings(DATABASE_REPLICAS=[], ALLOWED_HOSTS=['testserver', 'cdn.example.com'])
+class FilmDetailCacheTests(TestCase):
+    """
+    Every write that shows in a film's detail document drops the cached copy.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.france = Country.objects.create(name="France", code="FR")
+        cls.english = Language.objects.create(name="English")
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name="Drama"), Genre(name="Comedy")])
+        cls.gaumont = Studio.objects.create(name="Gaumont", founded_year=1895, country=cls.france)
+        cls.toho = Studio.objects.create(name="Toho", founded_year=1932)
+        cls.film = Film.objects.create(title="Both", year=1990)
+        cls.film.genres.set([cls.drama])
+        cls.film.studios.set([cls.gaumont])
+        cls.film.languages.set([cls.english])
+
+    def setUp(self):
+        cache.clear()
+        self.pk = self.film.pk
+
+    def detail(self, host='testserver'):
+        """
+        The film's detail, checking it was served from the cache when it
+        had been cached.
+        """
+        pk = self.pk
+        cached = get_film_detail(pk, host, get_film_generation(pk))
+        response = self.client.get(reverse('film-detail', args=[pk]), headers={'host': host})
+        if cached is not None:
+            self.assertEqual(response.json(), cached)
+        return response.json() if response.status_code == 200 else response.status_code
+
+    def write(self, change):
+        self.detail()  # cache it first
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        return self.detail()
+
+    def test_film_update_and_delete(self):
+        def update():
+            self.film.title = "Renamed"
+            self.film.save()
+        self.assertEqual(self.write(update)['title'], "Renamed")
+        self.assertEqual(self.write(self.film.delete), 404)
+
+    def test_relation_changes(self):
+        names = lambda data, field: sorted(item['name'] for item in data[field])
+        self.assertEqual(names(self.write(lambda: self.film.studios.add(self.toho)), 'studios'), ["Gaumont", "Toho"])
+        self.assertEqual(names(self.write(lambda: self.film.studios.remove(self.gaumont)), 'studios'), ["Toho"])
+        self.assertEqual(names(self.write(lambda: self.film.genres.set([self.comedy])), 'genres'), ["Comedy"])
+        # and from the other side of the relation
+        self.assertEqual(names(self.write(lambda: self.drama.film_set.add(self.film)), 'genres'), ["Comedy", "Drama"])
+        self.assertEqual(names(self.write(self.comedy.film_set.clear), 'genres'), ["Drama"])
+
+    def test_renaming_embedded_objects(self):
+        def rename(instance, name):
+            def change():
+                instance.name = name
+                instance.save()
+            return change
+        self.assertEqual(self.write(rename(self.drama, "Melodrama"))['genres'][0]['name'], "Melodrama")
+        self.assertEqual(self.write(rename(self.gaumont, "Pathé"))['studios'][0]['name'], "Pathé")
+        # embedded through the studio only
+        self.assertEqual(self.write(rename(self.france, "République"))['studios'][0]['country']['name'], "République")
+        self.assertEqual(self.write(rename(self.english, "Anglais"))['languages'][0]['name'], "Anglais")
+
+    def test_every_host_is_invalidated(self):
+        for host in ('testserver', 'cdn.example.com'):
+            self.detail(host)
+        generation = get_film_generation(self.film.pk)
+        self.assertIsNotNone(get_film_detail(self.film.pk, 'cdn.example.com', generation))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.film.genres.clear()
+        generation = get_film_generation(self.film.pk)
+        for host in ('testserver', 'cdn.example.com'):
+            with self.subTest(host=host):
+                self.assertIsNone(get_film_detail(self.film.pk, host, generation))
+                self.assertEqual(self.detail(host)['genres'], [])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class AsyncViewTests(TestCase):
+    """
+    The async read endpoints must answer exactly like their sync views.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name="Drama"), Genre(name="Comedy")])
+        cls.film = Film.objects.create(title="Both", year=1990, duration=100)
+        cls.film.genres.set([cls.drama, cls.comedy])
+        Film.objects.create(title="Neither", year=2000)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertSameResponse(self, sync_name, async_name, args=(), query=''):
+        sync = self.client.get(f"{reverse(sync_name, args=args)}?{query}")
+        response = self.client.get(f"{reverse(async_name, args=args)}?{query}")
+        self.assertEqual(response.status_code, sync.status_code)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), sync.json())
+        return response.json()
+
+    def test_lists(self):
+        for name in ('genre', 'theme', 'country', 'language', 'studio', 'film'):
+            with self.subTest(name=name):
+                self.assertSameResponse(f'{name}-list-create', f'{name}-list-async')
+        data = self.assertSameResponse('film-list-create', 'film-list-async', query=f'genres={self.drama.pk}')
+        self.assertEqual([film['title'] for film in data['results']], ["Both"])
+        self.assertSameResponse('film-list-create', 'film-list-async', query='year=abc')
+        self.assertSameResponse('film-list-create', 'film-list-async', query='genres=0')
+
+    def test_detail(self):
+        data = self.assertSameResponse('film-detail', 'film-detail-async', args=[self.film.pk])
+        self.assertEqual(data['title'], "Both")
+        # Second read comes from the response cache the sync view filled
+        with self.assertNumQueries(0):
+            self.client.get(reverse('film-detail-async', args=[self.film.pk]))
+        self.assertSameResponse('film-detail', 'film-detail-async', args=[self.film.pk], query='fields=id,title')
+        self.assertSameResponse('film-detail', 'film-detail-async', args=[0])
+
+    def test_read_only(self):
+        response = self.client.post(reverse('film-list-async'), {'title': "Nope", 'year': 2000})
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Film.objects.filter(title="Nope").exists())
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class ImportFilmsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama, cls.comedy = Genre.objects.bulk_create([Genre(name="Drama"), Genre(name="Comedy")])
+        cls.france = Country.objects.create(name="France", code="FR")
+        cls.gaumont = Studio.objects.create(name="Gaumont", founded_year=1895)
+
+    def import_films(self, name, content, *args):
+        """
+        Runs import_films on a file holding content, returning (stdout, stderr).
+        """
+        stdout, stderr = StringIO(), StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, name)
+            path.write_text(content, encoding='utf-8')
+            call_command('import_films', str(path), *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def relations(self, title):
+        film = Film.objects.get(title=title)
+        return (
+            sorted(film.genres.values_list('name', flat=True)),
+            list(film.countries.values_list('name', flat=True)),
+            list(film.studios.values_list('name', flat=True)),
+        )
+
+    def test_jsonl(self):
+        lines = [
+            {'title': "Amélie", 'year': 2001, 'duration': 122, 'genres': ["comedy", "Drama"], 'countries': ["fr"]},
+            {'title': "Heat", 'year': "1995", 'genres': ["Crime"], 'studios': ["GAUMONT"]},
+            {'title': "No year"},
+            {'title': "Bad year", 'year': "soon"},
+            ["not", "an", "object"],
+        ]
+        stdout, stderr = self.import_films('films.jsonl', '\n'.join(json.dumps(line) for line in lines) + '\n')
+        self.assertIn("2 created, 0 updated, 3 skipped", stdout)
+        self.assertEqual(self.relations("Amélie"), (["Comedy", "Drama"], ["France"], []))
+        self.assertEqual(self.relations("Heat"), ([], [], ["Gaumont"]))
+        self.assertEqual(Film.objects.get(title="Heat").year, 1995)
+        self.assertEqual(stderr.splitlines(), [
+            "Line 3 skipped: title and year are required",
+            "Line 4 skipped: invalid literal for int() with base 10: 'soon'",
+            "Line 5 skipped: expected an object",
+            "Unknown genres skipped: Crime",
+        ])
+
+    def test_csv(self):
+        content = (
+            'title,year,duration,genres,countries\n'
+            'Amélie,2001,,Drama|comedy,FR\n'
+            '"Two\nlines",1999,90,,\n'
+            'Bad,,90,,\n'
+        )
+        stdout, stderr = self.import_films('films.csv', content)
+        self.assertIn("2 created, 0 updated, 1 skipped", stdout)
+        self.assertEqual(self.relations("Amélie"), (["Comedy", "Drama"], ["France"], []))
+        self.assertIsNone(Film.objects.get(title="Amélie").duration)
+        self.assertEqual(Film.objects.get(title="Two\nlines").duration, 90)
+        self.assertEqual(stderr.splitlines(), ["Line 5 skipped: title and year are required"])
+
+    def test_upsert(self):
+        film = Film.objects.create(title="Heat", year=1995, tagline="Old", duration=170)
+        film.genres.set([self.drama])
+        film.studios.set([self.gaumont])
+        content = json.dumps({'title': "Heat", 'year': 1995, 'tagline': "New", 'genres': ["Comedy"]}) + '\n'
+        stdout, _ = self.import_films('films.jsonl', content, '--upsert')
+        self.assertIn("0 created, 1 updated", stdout)
+        film.refresh_from_db()
+        # only the columns and relations in the row change
+        self.assertEqual((film.tagline, film.duration), ("New", 170))
+        self.assertEqual(self.relations("Heat"), (["Comedy"], [], ["Gaumont"]))
+        # without --upsert the row is a new film
+        self.import_films('films.jsonl', content)
+        self.assertEqual(Film.objects.filter(title="Heat", year=1995).count(), 2)
+
+    def test_batches(self):
+        content = ''.join(
+            json.dumps({'title': f"Film {i}", 'year': 2000, 'genres': ["Drama", "Comedy"]}) + '\n' for i in range(5)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            stdout, _ = self.import_films('films.jsonl', content, '--batch-size', '2', '--m2m-batch-size', '3')
+        self.assertIn("5 created", stdout)
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT')]
+        # 2 + 2 + 1 films, and their 4 + 4 + 2 genre rows in chunks of at most 3
+        self.assertEqual(sum('"films_film" ' in sql for sql in inserts), 3)
+        self.assertEqual(sum('"films_film_genres"' in sql for sql in inserts), 5)
+        self.assertEqual(Film.genres.through.objects.count(), 10)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FilmSimilarTests(TestCase):
+    def similar(self, film):
+        return list(
+            SimilarFilm.objects.filter(film=film).order_by('-score', 'similar_id').values_list('similar_id', 'score')
+        )
+
+    def assertSameNeighbours(self, first, second):
+        self.assertEqual([pk for pk, _ in first], [pk for pk, _ in second])
+        for (_, a), (_, b) in zip(first, second):
+            self.assertAlmostEqual(a, b, places=5)
+
+    def test_endpoint(self):
+        drama, comedy, horror = Genre.objects.bulk_create([Genre(name="Drama"), Genre(name="Comedy"), Genre(name="Horror")])
+        first, twin, close, unrelated, alone = [
+            Film.objects.create(title=title, year=2000) for title in ("First", "Twin", "Close", "Unrelated", "Alone")
+        ]
+        first.genres.set([drama, comedy])
+        twin.genres.set([drama, comedy])
+        close.genres.set([drama])
+        unrelated.genres.set([horror])
+        call_command('build_film_similarity', '--full', stdout=StringIO())
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('film-similar', args=[first.pk]))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([film['title'] for film in results], ["Twin", "Close"])
+        self.assertAlmostEqual(results[0]['similarity'], 1.0, places=5)
+        self.assertLess(0, results[1]['similarity'])
+        self.assertLess(results[1]['similarity'], results[0]['similarity'])
+
+        self.assertEqual(self.client.get(reverse('film-similar', args=[alone.pk])).json(), [])
+        self.assertEqual(self.client.get(reverse('film-similar', args=[0])).status_code, 404)
+
+    def test_incremental_matches_full_for_affected_films(self):
+        genres = Genre.objects.bulk_create([Genre(name=f"Genre {i}") for i in range(12)])
+        films = Film.objects.bulk_create([Film(title=f"Film {i}", year=2000) for i in range(40)])
+        for i, film in enumerate(films):
+            film.genres.set([genres[i % 12], genres[(i * 5 + 1) % 12], genres[(i * 7 + 3) % 12]])
+        call_command('build_film_similarity', '--top-k', '5', '--block-size', '16', stdout=StringIO())
+        self.assertFalse(Film.objects.filter(similarity_stale=True).exists())
+        self.assertEqual(rebuild_similar_films(k=5), 0)
+
+        changed, twin = films[0], films[5]
+        listing = set(SimilarFilm.objects.filter(similar=changed).values_list('film_id', flat=True))
+        changed.genres.set(twin.genres.all())
+        self.assertEqual(list(Film.objects.filter(similarity_stale=True)), [changed])
+        self.assertLess(rebuild_similar_films(k=5, block_size=16), len(films))
+        incremental = {film.pk: self.similar(film) for film in films}
+
+        self.assertEqual(rebuild_similar_films(full=True, k=5, block_size=16), len(films))
+        full = {film.pk: self.similar(film) for film in films}
+        # The changed film and every film that listed it were recomputed exactly
+        for pk in {changed.pk} | listing:
+            with self.subTest(film=pk):
+                self.assertSameNeighbours(incremental[pk], full[pk])
+        # and films it now matches exactly picked it up
+        self.assertAlmostEqual(dict(incremental[twin.pk])[changed.pk], 1.0, places=5)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FilmAutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Film.objects.bulk_create([
+            Film(title="Realism", year=2001),
+            Film(title="The Alien Within", year=2002),
+            Film(title="Aliens", year=1986),
+            Film(title="Le Film", original_title="Alienation", year=1990),
+            Film(title="Alien", year=1979),
+            Film(title="Amélie", year=2001),
+            Film(title="Unrelated", year=2000),
+        ])
+        Studio.objects.create(name="Alibi Pictures")
+
+    def get(self, query):
+        response = self.client.get(f"{reverse('film-autocomplete')}?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def titles(self, query):
+        return [film['title'] for film in self.get(query)['films']]
+
+    def test_ranking(self):
+        # Field prefixes (shortest title first), then word prefixes, then substrings
+        self.assertEqual(self.titles('q=ali'), ["Alien", "Aliens", "Le Film", "The Alien Within", "Realism"])
+        self.assertEqual(self.titles('q=ALIEN&limit=2'), ["Alien", "Aliens"])
+
+    def test_short_terms_only_match_prefixes(self):
+        self.assertEqual(self.titles('q=al'), ["Alien", "Aliens", "Le Film"])
+
+    def test_response_shape_and_queries(self):
+        with self.assertNumQueries(1):
+            data = self.get('q=alie')
+        self.assertEqual(set(data), {'films'})
+        self.assertEqual(set(data['films'][0]), {'id', 'title', 'year'})
+        with self.assertNumQueries(2):  # one per list
+            data = self.get('q=alib&studios=1')
+        self.assertEqual((data['films'], [studio['name'] for studio in data['studios']]), ([], ["Alibi Pictures"]))
+        self.assertEqual(self.get('q=')['films'], [])
+        self.assertEqual(self.client.get(f"{reverse('film-autocomplete')}?q=a&limit=x").status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', "Accent folding needs unaccent()")
+    def test_accents_are_ignored(self):
+        for query in ('q=ame', 'q=AMÉ', 'q=amél'):
+            with self.subTest(query=query):
+                self.assertEqual(self.titles(query), ["Amélie"])
@@ -11,7 +11,11 @@ from .views import (
     StudioListCreateView,
     StudioRetrieveUpdateDestroyView,
     FilmListCreateView,
-    FilmRetrieveUpdateDestroyView
+    FilmRetrieveUpdateDestroyView,
+    FilmBatchView,
+    FilmFacetsView,
+    FilmSimilarView,
+    FilmAutocompleteView
 )
 
 urlpatterns = [
@@ -26,5 +30,9 @@ urlpatterns = [
     path('studios/', StudioListCreateView.as_view(), name='studio-list-create'),
     path('studios/<int:pk>/', StudioRetrieveUpdateDestroyView.as_view(), name='studio-detail'),
     path('films/', FilmListCreateView.as_view(), name='film-list-create'),
+    path('films/autocomplete/', FilmAutocompleteView.as_view(), name='film-autocomplete'),
+    path('films/facets/', FilmFacetsView.as_view(), name='film-facets'),
+    path('films/batch/', FilmBatchView.as_view(), name='film-batch'),
     path('films/<int:pk>/', FilmRetrieveUpdateDestroyView.as_view(), name='film-detail'),
+    path('films/<int:pk>/similar/', FilmSimilarView.as_view(), name='film-similar'),
 ]
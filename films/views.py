@@ -1,6 +1,18 @@
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics, permissions, filters
+from rest_framework import generics, permissions, filters, status
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from config.mixins import EagerLoadingMixin, SnapshotListMixin
+from config.routers import read_from_primary
+from config.serializers import is_sparse_request
 from users.permissions import IsRoleAdminOrStaff
+from .bulk import RELATION_FIELDS, bulk_set_relations
+from .cache import get_film_detail, get_film_generation, invalidate_film_details, set_film_detail
+from .filters import FilmFilterSet, FilmSearchFilter, autocomplete
 from .models import Genre, Theme, Country, Language, Studio, Film
 from .serializers import ( 
     GenreSerializer, 
@@ -10,11 +22,12 @@ from .serializers import (
     StudioSerializer,
     FilmListSerializer,
     FilmDetailSerializer,
-    FilmCreateUpdateSerializer
+    FilmCreateUpdateSerializer,
+    SimilarFilmSerializer
 )
 
 # 1. Genre views
-class GenreListCreateView(generics.ListCreateAPIView):
+class GenreListCreateView(SnapshotListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
     filter_backends = [
@@ -32,7 +45,7 @@ class GenreListCreateView(generics.ListCreateAPIView):
             return [IsRoleAdminOrStaff()]
         return [permissions.AllowAny()]
 
-class GenreRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class GenreRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Genre.objects.all()
     serializer_class = GenreSerializer
 
@@ -42,7 +55,7 @@ class GenreRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
     
 # 2. Theme views
-class ThemeListCreateView(generics.ListCreateAPIView):
+class ThemeListCreateView(SnapshotListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = Theme.objects.all()
     serializer_class = ThemeSerializer
     filter_backends = [
@@ -60,7 +73,7 @@ class ThemeListCreateView(generics.ListCreateAPIView):
             return [IsRoleAdminOrStaff()]
         return [permissions.AllowAny()]
 
-class ThemeRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class ThemeRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Theme.objects.all()
     serializer_class = ThemeSerializer
 
@@ -70,7 +83,7 @@ class ThemeRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
     
 # 3. Country views
-class CountryListCreateView(generics.ListCreateAPIView):
+class CountryListCreateView(SnapshotListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
     filter_backends = [
@@ -88,7 +101,7 @@ class CountryListCreateView(generics.ListCreateAPIView):
             return [IsRoleAdminOrStaff()]
         return [permissions.AllowAny()]
 
-class CountryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class CountryRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
 
@@ -98,7 +111,7 @@ class CountryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
 
 # 4. Language views
-class LanguageListCreateView(generics.ListCreateAPIView):
+class LanguageListCreateView(SnapshotListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = Language.objects.all()
     serializer_class = LanguageSerializer
     filter_backends = [
@@ -116,7 +129,7 @@ class LanguageListCreateView(generics.ListCreateAPIView):
             return [IsRoleAdminOrStaff()]
         return [permissions.AllowAny()]
 
-class LanguageRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class LanguageRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Language.objects.all()
     serializer_class = LanguageSerializer
 
@@ -126,7 +139,7 @@ class LanguageRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
 
 # 5. Studio views
-class StudioListCreateView(generics.ListCreateAPIView):
+class StudioListCreateView(SnapshotListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = Studio.objects.all()
     serializer_class = StudioSerializer
     filter_backends = [
@@ -144,7 +157,7 @@ class StudioListCreateView(generics.ListCreateAPIView):
             return [IsRoleAdminOrStaff()]
         return [permissions.AllowAny()]
 
-class StudioRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class StudioRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Studio.objects.all()
     serializer_class = StudioSerializer
 
@@ -154,15 +167,15 @@ class StudioRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.AllowAny()]
     
 # 6. Film views
-class FilmListCreateView(generics.ListCreateAPIView):
+class FilmListCreateView(EagerLoadingMixin, generics.ListCreateAPIView):
     queryset = Film.objects.all().order_by('id')
     filter_backends = [
         DjangoFilterBackend,
         filters.OrderingFilter,
-        filters.SearchFilter,
+        FilmSearchFilter,
     ]
-    # Filter by year, title, genres, etc.
-    filterset_fields = ['year', 'genres', 'themes', 'studios', 'countries', 'languages']
+    # Filter by year/duration/release date ranges and genres, themes, etc.
+    filterset_class = FilmFilterSet
     ordering_fields = ['id', 'year', 'title', 'duration']
     search_fields = ['title', 'original_title', 'tagline', 'description']
     ordering = ['id']
@@ -177,7 +190,7 @@ class FilmListCreateView(generics.ListCreateAPIView):
             return [IsRoleAdminOrStaff()]
         return [permissions.AllowAny()]
 
-class FilmRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class FilmRetrieveUpdateDestroyView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Film.objects.all()
 
     def get_serializer_class(self):
@@ -185,7 +198,213 @@ class FilmRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
             return FilmCreateUpdateSerializer
         return FilmDetailSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        if is_sparse_request(request):
+            # Only the full document is cached
+            return super().retrieve(request, *args, **kwargs)
+        pk, host = kwargs['pk'], request.get_host()
+        generation = get_film_generation(pk)
+        data = get_film_detail(pk, host, generation)
+        if data is None:
+            # Cached until the next write, so don't risk a lagging replica
+            with read_from_primary():
+                data = super().retrieve(request, *args, **kwargs).data
+            set_film_detail(pk, host, generation, data)
+        return Response(data)
+
     def get_permissions(self):
         if self.request.method in ['PATCH', 'PUT', 'DELETE']:
             return [IsRoleAdminOrStaff()]
-        return [permissions.AllowAny()]
\ No newline at end of file
+        return [permissions.AllowAny()]
+
+# 6.1. Film facets
+class FilmFacetsView(generics.GenericAPIView):
+    """
+    Counts per genre, theme, studio, country, language and decade for the
+    films matching the same filters/search as the film list, with one
+    grouped query per facet.
+    """
+    queryset = Film.objects.all()
+    permission_classes = [permissions.AllowAny]
+    pagination_class = None
+    filter_backends = [
+        DjangoFilterBackend,
+        FilmSearchFilter,
+    ]
+    filterset_class = FilmFilterSet
+    search_fields = FilmListCreateView.search_fields
+
+    def get(self, request):
+        films = self.filter_queryset(self.get_queryset()).order_by().values('pk')
+        data = {'count': Film.objects.filter(pk__in=films).count()}
+        for field in RELATION_FIELDS:
+            through = getattr(Film, field).through
+            target = getattr(Film, field).field.m2m_reverse_field_name()
+            rows = (
+                through.objects.filter(film_id__in=films)
+                .values_list(f'{target}_id', f'{target}__name')
+                .annotate(count=Count('film_id'))
+                .order_by('-count', f'{target}__name')
+            )
+            data[field] = [{'id': pk, 'name': name, 'count': count} for pk, name, count in rows]
+        data['years'] = list(
+            Film.objects.filter(pk__in=films)
+            .values(decade=F('year') / 10 * 10)
+            .annotate(count=Count('id'))
+            .order_by('decade')
+        )
+        return Response(data)
+
+# 6.2. Similar films
+class FilmSimilarView(EagerLoadingMixin, generics.ListAPIView):
+    """
+    The most similar films by shared genres, themes, studios, countries and
+    languages, best first, read from the index built by films.similarity.
+    """
+    queryset = Film.objects.all()
+    serializer_class = SimilarFilmSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            super().get_queryset()
+            .filter(similar_to__film_id=self.kwargs['pk'])
+            .annotate(similarity=F('similar_to__score'))
+            .order_by('-similarity', 'id')
+        )
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if not response.data and not Film.objects.filter(pk=self.kwargs['pk']).exists():
+            raise NotFound("Film not found.")
+        return response
+
+# 6.3. Autocomplete
+class FilmAutocompleteView(APIView):
+    """
+    Typeahead for the search box: ?q=<term> matches film titles and
+    original titles (plus studio names with ?studios=1), ignoring case and
+    accents, and returns only what a suggestion list shows. One query per
+    list.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    default_limit = 8
+    max_limit = 20
+
+    def get(self, request):
+        term = request.query_params.get('q', '').strip()
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        include_studios = request.query_params.get('studios') in ('1', 'true')
+        data = {'films': [], 'studios': []} if include_studios else {'films': []}
+        if term:
+            films = autocomplete(Film.objects.all(), ['title', 'original_title'], term, limit)
+            data['films'] = list(films.values('id', 'title', 'year'))
+            if include_studios:
+                studios = autocomplete(Studio.objects.all(), ['name'], term, limit)
+                data['studios'] = list(studios.values('id', 'name'))
+        response = Response(data)
+        response['Cache-Control'] = 'public, max-age=60'
+        return response
+
+# 7. Film batch create/update
+class FilmBatchView(APIView):
+    """
+    Creates or updates a list of films in one transaction. Items carrying an
+    `id` are partial updates, the rest are creates. Nothing is written
+    unless every item validates.
+    """
+    permission_classes = [IsRoleAdminOrStaff]
+    max_batch_size = 500
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            return Response({"detail": "Expected a non-empty list of films."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_batch_size:
+            return Response(
+                {"detail": f"At most {self.max_batch_size} films per batch."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        ids = [self.to_pk(item['id']) for item in items if 'id' in item]
+        films = Film.objects.in_bulk([pk for pk in ids if pk is not None])
+        context = {'request': request, 'preloaded': self.preload(items)}
+        serializers, errors, seen = [], [], set()
+        for item in items:
+            instance = None
+            if 'id' in item:
+                pk = self.to_pk(item['id'])
+                instance = films.get(pk)
+                if instance is None or pk in seen:
+                    message = "Film not found." if instance is None else "Duplicate id in batch."
+                    errors.append({'id': [message]})
+                    continue
+                seen.add(pk)
+            serializer = FilmCreateUpdateSerializer(instance, data=item, partial=instance is not None, context=context)
+            errors.append({} if serializer.is_valid() else serializer.errors)
+            serializers.append(serializer)
+
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': self.apply(serializers)}, status=status.HTTP_200_OK)
+
+    def to_pk(self, value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def preload(self, items):
+        """
+        Loads every referenced related object with one query per relation.
+        """
+        preloaded = {}
+        for field in RELATION_FIELDS:
+            ids = {
+                self.to_pk(pk)
+                for item in items if isinstance(item.get(field), list)
+                for pk in item[field]
+            }
+            ids.discard(None)
+            model = Film._meta.get_field(field).related_model
+            preloaded[model] = model.objects.in_bulk(ids)
+        return preloaded
+
+    @transaction.atomic
+    def apply(self, serializers):
+        now = timezone.now()
+        new_films, updated_films, films = [], [], []
+        updated_fields = {'updated_at'}
+        for serializer in serializers:
+            data = dict(serializer.validated_data)
+            relations = {field: [obj.pk for obj in data.pop(field)] for field in RELATION_FIELDS if field in data}
+            film = serializer.instance
+            if film is None:
+                film = Film(**data)
+                new_films.append(film)
+            else:
+                for field, value in data.items():
+                    setattr(film, field, value)
+                film.updated_at = now
+                updated_fields.update(data)
+                updated_films.append(film)
+            films.append((film, relations))
+
+        Film.objects.bulk_create(new_films)
+        if updated_films:
+            Film.objects.bulk_update(updated_films, sorted(updated_fields))
+        bulk_set_relations(films, replace={film.pk for film in updated_films})
+        Film.objects.filter(pk__in=[film.pk for film, _ in films]).update_search_vector()
+        invalidate_film_details(film.pk for film in updated_films)
+
+        created = {film.pk for film in new_films}
+        return [
+            {'id': film.pk, 'status': 'created' if film.pk in created else 'updated'}
+            for film, _ in films
+        ]
@@ -0,0 +1,8 @@
+from django.urls import path
+from .async_views import user_detail, user_followers, user_following
+
+urlpatterns = [
+    path('users/<int:id>/', user_detail, name='user-detail-async'),
+    path('users/<int:id>/followers/', user_followers, name='user-followers-async'),
+    path('users/<int:id>/following/', user_following, name='user-following-async'),
+]
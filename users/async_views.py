@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from config.asyncviews import async_api_view, async_detail_view, json_response
+from .follows import NDJSON_CONTENT_TYPE, aexport_ndjson, edge_user, follow_edges, is_export
+from .serializers import FollowUserSerializer
+from .views import UserDetailView
+
+User = get_user_model()
+
+# Async (ASGI) read-only counterparts of the hot GET endpoints in views.py
+
+# 1. User detail
+user_detail = async_detail_view(UserDetailView)
+
+# 2. Followers / following
+async def follow_list(request, id, kind):
+    if not await User.objects.filter(id=id).aexists():
+        return json_response({"detail": "User not found."}, status=404)
+    edges = follow_edges(id, kind)
+    if is_export(request):
+        serializer = FollowUserSerializer(context={'request': request})
+        return StreamingHttpResponse(aexport_ndjson(serializer, edges, kind), content_type=NDJSON_CONTENT_TYPE)
+    drf_request = Request(request)
+    paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+    page = await paginator.apaginate_queryset(edges, drf_request)
+    users = [edge_user(follow, kind) for follow in page]
+    serializer = FollowUserSerializer(users, many=True, context={'request': drf_request})
+    return json_response(paginator.get_paginated_response(serializer.data).data)
+
+@async_api_view
+async def user_followers(request, id):
+    """
+    List followers of the user with id=<id>
+    """
+    return await follow_list(request, id, 'followers')
+
+@async_api_view
+async def user_following(request, id):
+    """
+    List users the user with id=<id> is following
+    """
+    return await follow_list(request, id, 'following')
@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .blacklist import uses_shared_cache
+from .models import CLAIM_FIELDS
+
+User = get_user_model()
+
+TOKEN_VERSION_CLAIM = 'token_version'
+
+
+def add_user_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+def token_version_cache_key(user_id):
+    return f'token-version:{user_id}'
+
+
+def get_token_version(user_id):
+    """
+    Current token version of a user, read through the shared cache. Returns
+    None for unknown users. Misses read the primary so a revocation can't
+    be undone by caching a replica's older version, and only add() to the
+    cache so they can't overwrite the version revoke_tokens() sets. A
+    per-process cache never hears of revocations made in other workers, so
+    without a shared one every lookup reads the primary.
+    """
+    if not uses_shared_cache():
+        return User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list('token_version', flat=True).first()
+    key = token_version_cache_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user_id).values_list('token_version', flat=True).first()
+        if version is not None:
+            cache.add(key, version, timeout=None)
+    return version
+
+
+def check_token_version(token):
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if token.get(TOKEN_VERSION_CLAIM) != get_token_version(user_id):
+        raise AuthenticationFailed("Token has been revoked.", code='token_revoked')
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    request.user built from token claims. Claim attributes (id, username,
+    role, ...) are answered from the token; anything else loads the User
+    row once and delegates to it.
+    """
+    def __init__(self, token):
+        # simplejwt writes the id claim as a string
+        user_id = User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM])
+        super().__init__(lambda: User.objects.get(**{api_settings.USER_ID_FIELD: user_id}))
+        claims = {field: token[field] for field in CLAIM_FIELDS}
+        claims.update(id=user_id, pk=user_id, is_authenticated=True, is_anonymous=False)
+        self.__dict__['_claims'] = claims
+
+    def __bool__(self):
+        return True
+
+    def __getattr__(self, name):
+        claims = self.__dict__['_claims']
+        if name in claims and self._wrapped is empty:
+            return claims[name]
+        return super().__getattr__(name)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the user claims embedded in the access
+    token instead of loading the User row. Tokens issued before claims were
+    added fall back to the database lookup.
+    """
+    def get_user(self, validated_token):
+        if any(field not in validated_token for field in CLAIM_FIELDS + (TOKEN_VERSION_CLAIM,)):
+            return super().get_user(validated_token)
+        check_token_version(validated_token)
+        if api_settings.CHECK_USER_IS_ACTIVE and not validated_token['is_active']:
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        return ClaimsUser(validated_token)
@@ -0,0 +1,156 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Shared state: VERSION counts blacklisted tokens (each one's jti is kept
+# under its version number), GENERATION moves when rows are purged
+VERSION_KEY = 'token-blacklist:version'
+GENERATION_KEY = 'token-blacklist:generation'
+
+
+def jti_key(version):
+    return f'token-blacklist:jti:{version}'
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: no false negatives, false
+    positives at roughly error_rate once `capacity` items are added.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    Process-local Bloom filter of blacklisted refresh-token jtis. It is
+    loaded from BlacklistedToken, then topped up from the jtis published in
+    the shared cache as the version counter moves. It is rebuilt from the
+    database after a purge, when a published jti is missing, or every
+    TOKEN_BLACKLIST_REBUILD_INTERVAL seconds.
+
+    A miss proves a token is not blacklisted; a hit is confirmed against the
+    database.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = self.generation = 0
+        self.built_at = 0
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self.bloom
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def sync(self):
+        state = cache.get_many([VERSION_KEY, GENERATION_KEY])
+        version, generation = state.get(VERSION_KEY, 0), state.get(GENERATION_KEY, 0)
+        stale = time.monotonic() - self.built_at > settings.TOKEN_BLACKLIST_REBUILD_INTERVAL
+        if self.bloom is not None and (version, generation) == (self.version, self.generation) and not stale:
+            return
+        with self.lock:
+            if (
+                self.bloom is None or stale or generation != self.generation
+                or version < self.version or self.bloom.count >= self.bloom.capacity
+                or not self.top_up(version)
+            ):
+                self.rebuild()
+            self.version, self.generation = version, generation
+
+    def top_up(self, version):
+        """
+        Adds the jtis published since the last sync. Returns False when one
+        of them is no longer in the cache.
+        """
+        keys = [jti_key(v) for v in range(self.version + 1, version + 1)]
+        jtis = cache.get_many(keys)
+        if len(jtis) < len(keys):
+            return False
+        for jti in jtis.values():
+            self.bloom.add(jti)
+        return True
+
+    def rebuild(self):
+        # From the primary: a lagging replica would miss recent logouts
+        tokens = BlacklistedToken.objects.using(DEFAULT_DB_ALIAS)
+        count = tokens.count()
+        bloom = BloomFilter(max(settings.TOKEN_BLACKLIST_FILTER_CAPACITY, count * 2))
+        for jti in tokens.values_list('token__jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        self.bloom = bloom
+        self.built_at = time.monotonic()
+
+
+blacklist_filter = BlacklistFilter()
+
+
+def publish_blacklisted(jti):
+    """
+    Announces a newly blacklisted jti to every process's filter.
+    """
+    blacklist_filter.add(jti)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        version = cache.incr(VERSION_KEY)
+    cache.set(jti_key(version), jti, timeout=settings.TOKEN_BLACKLIST_REBUILD_INTERVAL * 2)
+
+
+def uses_shared_cache():
+    """
+    Whether the default cache is shared by every worker. Only then do
+    logouts in one worker reach the filters of the others.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def bump_blacklist_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist check only queries the database when the
+    in-process filter can't rule the token out. Without a shared cache the
+    filters can't learn about logouts in other workers, so every check goes
+    to the database.
+    """
+    def check_blacklist(self):
+        if not uses_shared_cache() or blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
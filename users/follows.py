@@ -0,0 +1,160 @@
+import json
+
+from django.db import connection, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+from .models import Follow, User
+from .suggestions import publish_follow_event
+
+# {list: (column holding the listed user's id, column of the users listed)}
+FOLLOW_LISTS = {
+    'followers': ('from_user', 'to_user'),
+    'following': ('to_user', 'from_user'),
+}
+
+# One statement per call: the edge insert/delete is conflict tolerant and both
+# counter updates only count edges that actually changed. Returns the
+# (id, username) of every user whose follower set changed.
+FOLLOW_SQL = """
+WITH changed AS (
+    INSERT INTO {follow} (from_user_id, to_user_id, created_at)
+    SELECT id, %(follower)s, %(now)s FROM {user} WHERE id = ANY(%(ids)s) AND id <> %(follower)s
+    ON CONFLICT (from_user_id, to_user_id) DO NOTHING
+    RETURNING from_user_id
+), followed AS (
+    UPDATE {user} SET followers_count = followers_count + 1
+    WHERE id IN (SELECT from_user_id FROM changed)
+    RETURNING id, username
+), follower AS (
+    UPDATE {user} SET following_count = following_count + (SELECT count(*) FROM changed)
+    WHERE id = %(follower)s AND EXISTS (SELECT 1 FROM changed)
+)
+SELECT id, username FROM followed
+"""
+
+UNFOLLOW_SQL = """
+WITH changed AS (
+    DELETE FROM {follow} WHERE to_user_id = %(follower)s AND from_user_id = ANY(%(ids)s)
+    RETURNING from_user_id
+), followed AS (
+    UPDATE {user} SET followers_count = followers_count - 1
+    WHERE id IN (SELECT from_user_id FROM changed)
+    RETURNING id, username
+), follower AS (
+    UPDATE {user} SET following_count = following_count - (SELECT count(*) FROM changed)
+    WHERE id = %(follower)s AND EXISTS (SELECT 1 FROM changed)
+)
+SELECT id, username FROM followed
+"""
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+EXPORT_CHUNK_SIZE = 2000
+
+
+def follow_edges(user_id, kind):
+    """
+    Follow rows behind a user's followers/following list, newest first,
+    with the listed users joined in.
+    """
+    owner, other = FOLLOW_LISTS[kind]
+    return Follow.objects.filter(**{owner: user_id}).select_related(other).order_by('-created_at', '-id')
+
+
+def edge_user(follow, kind):
+    """
+    The listed user of a Follow row, carrying the follow time as followed_at.
+    """
+    user = getattr(follow, FOLLOW_LISTS[kind][1])
+    user.followed_at = follow.created_at
+    return user
+
+
+def is_export(request):
+    return request.GET.get('export') == 'ndjson'
+
+
+def ndjson_line(serializer, follow, kind):
+    return json.dumps(serializer.to_representation(edge_user(follow, kind)), cls=JSONEncoder) + '\n'
+
+
+def export_ndjson(serializer, edges, kind):
+    """
+    Streams every row of edges as one JSON document per line. iterator()
+    uses a server-side cursor on PostgreSQL, so memory stays flat however
+    long the list is.
+    """
+    for follow in edges.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield ndjson_line(serializer, follow, kind)
+
+
+async def aexport_ndjson(serializer, edges, kind):
+    async for follow in edges.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield ndjson_line(serializer, follow, kind)
+
+
+def _run_follow_sql(sql, follower_id, ids):
+    connection = connections[router.db_for_write(Follow)]
+    quote = connection.ops.quote_name
+    sql = sql.format(follow=quote(Follow._meta.db_table), user=quote(User._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'follower': follower_id, 'ids': list(ids), 'now': timezone.now()})
+        return dict(cursor.fetchall())
+
+
+def follow_users(follower_id, ids):
+    """
+    Makes follower_id follow every user in ids, skipping unknown ids, itself
+    and users it already follows. Returns {id: username} of the new follows.
+    """
+    if not ids:
+        return {}
+    if connection.vendor == 'postgresql':
+        return _published(follower_id, _run_follow_sql(FOLLOW_SQL, follower_id, ids), True)
+    with transaction.atomic():
+        existing = Follow.objects.filter(to_user_id=follower_id, from_user_id__in=ids).values('from_user_id')
+        users = dict(
+            User.objects.filter(id__in=ids).exclude(id=follower_id).exclude(id__in=existing)
+            .values_list('id', 'username')
+        )
+        Follow.objects.bulk_create(
+            [Follow(from_user_id=pk, to_user_id=follower_id) for pk in users], ignore_conflicts=True
+        )
+        _update_counters(follower_id, users, 1)
+    return _published(follower_id, users, True)
+
+
+def unfollow_users(follower_id, ids):
+    """
+    Makes follower_id stop following every user in ids. Returns
+    {id: username} of the removed follows.
+    """
+    if not ids:
+        return {}
+    if connection.vendor == 'postgresql':
+        return _published(follower_id, _run_follow_sql(UNFOLLOW_SQL, follower_id, ids), False)
+    with transaction.atomic():
+        edges = Follow.objects.filter(to_user_id=follower_id, from_user_id__in=ids)
+        users = dict(
+            User.objects.filter(id__in=edges.values('from_user_id')).values_list('id', 'username')
+        )
+        edges.delete()
+        _update_counters(follower_id, users, -1)
+    return _published(follower_id, users, False)
+
+
+def _update_counters(follower_id, users, delta):
+    if users:
+        User.objects.filter(id__in=list(users)).update(followers_count=F('followers_count') + delta)
+        User.objects.filter(id=follower_id).update(following_count=F('following_count') + delta * len(users))
+
+
+def _published(follower_id, users, added):
+    """
+    Queues the follow graph event for users once the transaction commits.
+    """
+    if users:
+        # Ids as ints, like the ones FollowGraph.rebuild() reads
+        follower, user_ids = int(follower_id), [int(pk) for pk in users]
+        transaction.on_commit(lambda: publish_follow_event(follower, user_ids, added))
+    return users
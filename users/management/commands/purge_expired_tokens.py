@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from users.blacklist import bump_blacklist_generation
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding (and blacklisted) refresh tokens in small batches. "
+        "Safe to run from cron while another run is still going."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Tokens deleted per transaction.")
+        parser.add_argument('--sleep', type=float, default=0, help="Seconds to pause between batches.")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            with transaction.atomic():
+                expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+                if connection.features.has_select_for_update_skip_locked:
+                    # Concurrent runs take disjoint batches instead of waiting
+                    expired = expired.select_for_update(skip_locked=True)
+                ids = list(expired.values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                BlacklistedToken.objects.filter(token_id__in=ids).delete()
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            batches += 1
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if deleted:
+            # Filters still hold the purged jtis; let them rebuild smaller
+            bump_blacklist_generation()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired tokens in {batches} batches."))
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild User.followers_count/following_count from the followers through table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Users updated per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        Follow = User.followers.through
+        followers = Follow.objects.filter(from_user=OuterRef('pk')).values('from_user').annotate(c=Count('*')).values('c')
+        following = Follow.objects.filter(to_user=OuterRef('pk')).values('to_user').annotate(c=Count('*')).values('c')
+
+        # Walk the id space in ranges so each UPDATE only locks one batch of rows
+        last_id, updated = 0, 0
+        while True:
+            ids = list(
+                User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += User.objects.filter(id__gte=ids[0], id__lte=ids[-1]).update(
+                    followers_count=Coalesce(Subquery(followers), 0),
+                    following_count=Coalesce(Subquery(following), 0),
+                )
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt follow counters for {updated} users."))
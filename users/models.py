@@ -1,9 +1,16 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# User attributes copied into every token at issue time (users.authentication)
+CLAIM_FIELDS = ('username', 'role', 'is_staff', 'is_superuser', 'is_active')
 
 class User(AbstractUser):
     # Additional fields
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     social = models.URLField(blank=True)
     
@@ -16,10 +23,90 @@ class User(AbstractUser):
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='user')
     followers = models.ManyToManyField(
         'self',
+        through='Follow',
         symmetrical=False,
         related_name='following',
         blank=True
     )
+    # Denormalized counters, kept in sync by follow()/unfollow()
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Embedded in issued tokens; bumping it revokes their claims
+    token_version = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.username
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._remember_claims()
+        return user
+
+    def _remember_claims(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_claims = {field: getattr(self, field) for field in CLAIM_FIELDS if field not in deferred}
+
+    def save(self, *args, **kwargs):
+        """
+        Revokes the user's tokens when a field they carry as a claim changes,
+        e.g. deactivation or a new role. QuerySet.update() bypasses this, so
+        call revoke_tokens() after updating those fields in bulk.
+        """
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_claims', {})
+        changed = not self._state.adding and any(
+            getattr(self, field) != value for field, value in loaded.items()
+            if update_fields is None or field in update_fields
+        )
+        super().save(*args, **kwargs)
+        self._remember_claims()
+        if changed:
+            self.revoke_tokens()
+
+    def revoke_tokens(self):
+        """
+        Invalidates every token issued to this user so stale claims (e.g. an
+        old role) stop being accepted.
+        """
+        from .authentication import token_version_cache_key
+        User.objects.filter(pk=self.pk).update(token_version=F('token_version') + 1)
+        self.refresh_from_db(fields=['token_version'])
+        key, version = token_version_cache_key(self.pk), self.token_version
+        # Overwrites whatever a concurrent read cached, see get_token_version()
+        transaction.on_commit(lambda: cache.set(key, version, timeout=None))
+
+    def follow(self, user):
+        """
+        Make self follow user. Returns True if a new edge was created.
+        """
+        from .follows import follow_users
+        return bool(follow_users(self.pk, [user.pk]))
+
+    def unfollow(self, user):
+        """
+        Make self stop following user. Returns True if an edge was removed.
+        """
+        from .follows import unfollow_users
+        return bool(unfollow_users(self.pk, [user.pk]))
+
+
+class Follow(models.Model):
+    """
+    Through model of User.followers: to_user follows from_user.
+    """
+    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'users_user_followers'
+        unique_together = [('from_user', 'to_user')]
+        indexes = [
+            # Followers / following lists, newest first
+            models.Index(fields=['from_user', '-created_at', '-id'], name='follow_followers_idx'),
+            models.Index(fields=['to_user', '-created_at', '-id'], name='follow_following_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.to_user_id} -> {self.from_user_id}'
@@ -1,7 +1,11 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .authentication import TOKEN_VERSION_CLAIM, add_user_claims, check_token_version
+from .blacklist import FilteredRefreshToken
+from config.images import ImageSrcsetField
+from config.serializers import SparseFieldsMixin
 
 User = get_user_model()
 
@@ -30,35 +34,45 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
-class UserPublicSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+class UserPublicSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    avatar_srcset = ImageSrcsetField('avatar')
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'avatar', 'bio', 'social', 'followers_count', 'following_count')
+        fields = ('id', 'username', 'avatar', 'avatar_srcset', 'bio', 'social', 'followers_count', 'following_count')
         read_only_fields = fields
-    
-    def get_followers_count(self, obj):
-        return obj.followers.count()
 
-    def get_following_count(self, obj):
-        return obj.following.count()
-    
-class UserPrivateSerializer(serializers.ModelSerializer):
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+class FollowUserSerializer(UserPublicSerializer):
+    """
+    A follower or followed user, with when the follow happened.
+    """
+    followed_at = serializers.DateTimeField(read_only=True)
+
+    class Meta(UserPublicSerializer.Meta):
+        fields = UserPublicSerializer.Meta.fields + ('followed_at',)
+        read_only_fields = fields
+
+class SuggestedUserSerializer(UserPublicSerializer):
+    """
+    A suggested user, with how many of the users you follow follow them.
+    """
+    mutual_count = serializers.IntegerField(read_only=True)
+
+    class Meta(UserPublicSerializer.Meta):
+        fields = UserPublicSerializer.Meta.fields + ('mutual_count',)
+        read_only_fields = fields
+
+class BulkFollowSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100)
+    action = serializers.ChoiceField(choices=['follow', 'unfollow'], default='follow')
+
+class UserPrivateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    avatar_srcset = ImageSrcsetField('avatar')
 
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'avatar', 'bio', 'social', 'role', 'followers_count', 'following_count')
+        fields = ('id', 'username', 'email', 'avatar', 'avatar_srcset', 'bio', 'social', 'role', 'followers_count', 'following_count')
         read_only_fields = fields
-    
-    def get_followers_count(self, obj):
-        return obj.followers.count()
-
-    def get_following_count(self, obj):
-        return obj.following.count()
 
 class UserEditProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -70,7 +84,22 @@ class UserRoleUpdateSerializer(serializers.ModelSerializer):
         model = User
         fields = ('role',)
 
-class AdminTokenObtainPairSerializer(TokenObtainPairSerializer):
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        # Tokens issued before claims were added carry no version to check
+        if TOKEN_VERSION_CLAIM in refresh:
+            check_token_version(refresh)
+        return super().validate(attrs)
+
+class AdminTokenObtainPairSerializer(ClaimsTokenObtainPairSerializer):
     def validate(self, attrs):
         data = super().validate(attrs)
         if self.user.role not in ["admin", "staff"]:
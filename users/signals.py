@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from config.images import needs_variants, schedule_variants
+from .blacklist import publish_blacklisted
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def schedule_avatar_variants(sender, instance, **kwargs):
+    if needs_variants(instance, 'avatar'):
+        schedule_variants(instance, 'avatar')
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def publish_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        jti = instance.token.jti
+        transaction.on_commit(lambda: publish_blacklisted(jti))
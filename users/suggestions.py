@@ -0,0 +1,136 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from .models import Follow
+
+# Shared state: VERSION counts follow/unfollow events, each one kept under
+# its version number as (follower id, [followed ids], added)
+VERSION_KEY = 'follow-graph:version'
+
+
+def event_key(version):
+    return f'follow-graph:event:{version}'
+
+
+def _contains(ids, user_id):
+    i = bisect_left(ids, user_id)
+    return i < len(ids) and ids[i] == user_id
+
+
+def _spread(ids, limit):
+    """
+    At most limit ids, taken evenly across the whole array.
+    """
+    if len(ids) <= limit:
+        return ids
+    step = len(ids) / limit
+    return [ids[int(i * step)] for i in range(limit)]
+
+
+class FollowGraph:
+    """
+    Process-local copy of the follow graph: for every user, the sorted ids
+    of the users they follow, as compact 64-bit arrays. It is loaded from
+    Follow, then kept current from the follow/unfollow events published in
+    the shared cache. It is rebuilt when an event is missing, or every
+    FOLLOW_SUGGESTIONS_REBUILD_INTERVAL seconds.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.following = None
+        self.version = 0
+        self.built_at = 0
+
+    def sync(self):
+        version = cache.get(VERSION_KEY, 0)
+        stale = time.monotonic() - self.built_at > settings.FOLLOW_SUGGESTIONS_REBUILD_INTERVAL
+        if self.following is not None and version == self.version and not stale:
+            return
+        with self.lock:
+            if self.following is None or stale or version < self.version or not self.catch_up(version):
+                self.rebuild()
+            self.version = version
+
+    def catch_up(self, version):
+        """
+        Applies the events published since the last sync. Returns False when
+        one of them is no longer in the cache.
+        """
+        keys = [event_key(v) for v in range(self.version + 1, version + 1)]
+        events = cache.get_many(keys)
+        if len(events) < len(keys):
+            return False
+        for key in keys:
+            self.apply(*events[key])
+        return True
+
+    def apply(self, follower_id, user_ids, added):
+        ids = self.following.setdefault(int(follower_id), array('q'))
+        for user_id in map(int, user_ids):
+            i = bisect_left(ids, user_id)
+            present = i < len(ids) and ids[i] == user_id
+            if added and not present:
+                ids.insert(i, user_id)
+            elif not added and present:
+                del ids[i]
+
+    def rebuild(self):
+        following = {}
+        # From the primary: events up to self.version must all be in it
+        edges = (
+            Follow.objects.using(DEFAULT_DB_ALIAS).order_by('to_user_id', 'from_user_id')
+            .values_list('to_user_id', 'from_user_id')
+        )
+        current, ids = None, None
+        for follower_id, user_id in edges.iterator(chunk_size=10000):
+            if follower_id != current:
+                current, ids = follower_id, following.setdefault(follower_id, array('q'))
+            ids.append(user_id)
+        self.following = following
+        self.built_at = time.monotonic()
+
+    def suggest(self, user_id, limit):
+        """
+        Friend-of-friend suggestions for user_id as [(id, mutual count)],
+        best first. The mutual count is how many of the users user_id follows
+        also follow the candidate. Work is bounded by sampling at most
+        FOLLOW_SUGGESTIONS_MAX_FANOUT followed users and at most
+        FOLLOW_SUGGESTIONS_MAX_PER_FRIEND of each one's follows.
+        """
+        self.sync()
+        following = self.following
+        empty = array('q')
+        followed = following.get(user_id, empty)
+        scores = Counter()
+        for friend_id in _spread(followed, settings.FOLLOW_SUGGESTIONS_MAX_FANOUT):
+            scores.update(_spread(following.get(friend_id, empty), settings.FOLLOW_SUGGESTIONS_MAX_PER_FRIEND))
+        candidates = (
+            (candidate, score) for candidate, score in scores.items()
+            if candidate != user_id and not _contains(followed, candidate)
+        )
+        return heapq.nlargest(limit, candidates, key=lambda item: (item[1], -item[0]))
+
+
+follow_graph = FollowGraph()
+
+
+def publish_follow_event(follower_id, user_ids, added):
+    """
+    Announces follows (or unfollows) to every process's graph.
+    """
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        version = cache.incr(VERSION_KEY)
+    cache.set(
+        event_key(version), (follower_id, list(user_ids), added),
+        timeout=settings.FOLLOW_SUGGESTIONS_REBUILD_INTERVAL * 2,
+    )
@@ -1,3 +1,429 @@
-from django.test import TestCase
+import json
+from contextlib import ExitStack
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from config.pagination import KeysetPagination
+from . import blacklist
+from .authentication import ClaimsJWTAuthentication, ClaimsUser, get_token_version
+from .models import Follow, User
+from .serializers import ClaimsTokenObtainPairSerializer
+from .suggestions import follow_graph
+
+
+def bearer(user):
+    return {'Authorization': f'Bearer {ClaimsTokenObtainPairSerializer.get_token(user).access_token}'}
+
+
+@override_settings(DATABASE_REPLICAS=[])  # replicas can't see the test transaction
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice')
+
+    def test_request_user_answers_from_claims(self):
+        request = APIRequestFactory().get('/', headers=bearer(self.alice))
+        with self.assertNumQueries(1):  # the token version
+            request_user = ClaimsJWTAuthentication().authenticate(request)[0]
+            self.assertIsInstance(request_user, ClaimsUser)
+            self.assertEqual(request_user.pk, self.alice.pk)
+            self.assertEqual(request_user.id, self.alice.pk)
+            self.assertEqual(request_user.username, 'alice')
+
+    def test_claim_changes_revoke_tokens(self):
+        for field, value in [('is_active', False), ('role', 'admin'), ('username', 'alicia')]:
+            with self.subTest(field=field):
+                user = User.objects.create_user(username=f'user-{field}')
+                request = APIRequestFactory().get('/', headers=bearer(user))
+                ClaimsJWTAuthentication().authenticate(request)  # caches the current version
+                with self.captureOnCommitCallbacks(execute=True):
+                    setattr(user, field, value)
+                    user.save()
+                self.assertEqual(get_token_version(user.pk), user.token_version)
+                with self.assertRaises(AuthenticationFailed):
+                    ClaimsJWTAuthentication().authenticate(request)
+
+    def test_token_versions_are_cached_only_in_a_shared_cache(self):
+        request = APIRequestFactory().get('/', headers=bearer(self.alice))
+        for shared, queries in [(False, 1), (True, 0)]:
+            with self.subTest(shared_cache=shared), mock.patch('users.authentication.uses_shared_cache', return_value=shared):
+                ClaimsJWTAuthentication().authenticate(request)
+                with self.assertNumQueries(queries):
+                    ClaimsJWTAuthentication().authenticate(request)
+
+    def test_role_change_in_another_worker_rejects_issued_tokens(self):
+        request = APIRequestFactory().get('/', headers=bearer(self.alice))
+        ClaimsJWTAuthentication().authenticate(request)  # caches the version in this worker's LocMemCache
+        # another worker saves the change: its on_commit cache update never reaches this process
+        user = User.objects.get(pk=self.alice.pk)
+        user.role = 'admin'
+        user.save()
+        with self.assertRaises(AuthenticationFailed):
+            ClaimsJWTAuthentication().authenticate(request)
+
+    def test_other_changes_keep_tokens(self):
+        version = self.alice.token_version
+        user = User.objects.get(pk=self.alice.pk)
+        user.bio = "Hi"
+        user.save()
+        self.assertEqual(user.token_version, version)
+
+    def test_refresh_tokens_without_claims_still_refresh(self):
+        refresh = RefreshToken.for_user(self.alice)
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200, response.content)
+        # and its access token authenticates through the database lookup
+        headers = {'Authorization': f"Bearer {response.json()['access']}"}
+        self.assertEqual(self.client.get(reverse('profile'), headers=headers).status_code, 200)
+
+    def test_revoked_refresh_tokens_are_rejected(self):
+        refresh = ClaimsTokenObtainPairSerializer.get_token(self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.revoke_tokens()
+        response = self.client.post(reverse('token_refresh'), {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_role_update_revokes_tokens(self):
+        admin = User.objects.create_user(username='admin', role='admin')
+        headers = bearer(self.alice)
+        self.assertEqual(self.client.get(reverse('profile'), headers=headers).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('update-user-role', args=[self.alice.pk]), {'role': 'staff'},
+                content_type='application/json', headers=bearer(admin),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile'), headers=headers).status_code, 401)
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "Set DB_REPLICA_URLS (e.g. a second local database) to test replica routing")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Replicas mirror the default test database, so these check which alias
+    each request's queries are sent to rather than what they return. Data
+    has to be committed for the replica connections to see it, hence
+    TransactionTestCase.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username='alice', password='secret')
+        self.bob = User.objects.create_user(username='bob', password='secret')
+
+    def request(self, method, url, user=None, **kwargs):
+        """
+        Performs the request and returns the aliases its queries ran on.
+        """
+        headers = {}
+        if user is not None:
+            headers['Authorization'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+        with ExitStack() as stack:
+            contexts = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections}
+            response = getattr(self.client, method)(url, headers=headers, **kwargs)
+        self.assertLess(response.status_code, 400, response.content)
+        return {alias for alias, context in contexts.items() if len(context)}
+
+    def test_anonymous_reads_use_a_replica(self):
+        aliases = self.request('get', reverse('user-detail', args=[self.bob.pk]))
+        self.assertEqual(len(aliases), 1)
+        self.assertIn(aliases.pop(), settings.DATABASE_REPLICAS)
+
+    def test_writes_use_the_primary(self):
+        aliases = self.request('post', reverse('user-follow', args=[self.bob.pk]), user=self.alice)
+        self.assertEqual(aliases, {DEFAULT_DB_ALIAS})
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        url = reverse('user-following', args=[self.alice.pk])
+        self.assertNotIn(DEFAULT_DB_ALIAS, self.request('get', url, user=self.alice))
+        self.request('patch', reverse('edit-profile'), user=self.alice, data={'bio': "Hi"}, content_type='application/json')
+        self.assertEqual(self.request('get', url, user=self.alice), {DEFAULT_DB_ALIAS})
+        # Other users keep reading from the replicas
+        self.assertNotIn(DEFAULT_DB_ALIAS, self.request('get', url, user=self.bob))
+
+
+@override_settings(DATABASE_REPLICAS=[])
+@mock.patch.object(KeysetPagination, 'page_size', 4)
+class UserListPrivatePaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', role='admin')
+        roles = ['user', 'staff', 'admin']
+        User.objects.bulk_create([User(username=f'member-{i:02}', role=roles[i % 3]) for i in range(21)])
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url, headers=bearer(self.admin))
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            pages.append([user['id'] for user in data['results']])
+            url = data[link]
+        return pages, data
+
+    def test_every_ordering_pages_through_once(self):
+        for name in ('id', 'username', 'role'):
+            for desc in (False, True):
+                ordering = f"{'-' if desc else ''}{name}"
+                with self.subTest(ordering=ordering):
+                    expected = [pk for _, pk in sorted(User.objects.values_list(name, 'id'), reverse=desc)]
+                    pages, last = self.walk(f"{reverse('user-list-private')}?ordering={ordering}", 'next')
+                    self.assertEqual(sum(pages, []), expected)
+                    back, _ = self.walk(last['previous'], 'previous')
+                    self.assertEqual(back, pages[-2::-1])
+
+    def test_page_numbers_opt_in(self):
+        response = self.client.get(f"{reverse('user-list-private')}?page=2", headers=bearer(self.admin))
+        data = response.json()
+        self.assertEqual(data['count'], 22)
+        self.assertEqual([user['id'] for user in data['results']], sorted(User.objects.values_list('id', flat=True))[20:])
+
+    def test_bad_cursors_are_rejected(self):
+        url = reverse('user-list-private')
+        next_link = self.client.get(f'{url}?ordering=role', headers=bearer(self.admin)).json()['next']
+        for query in ('cursor=garbage', next_link.split('?')[1].replace('ordering=role', 'ordering=username')):
+            with self.subTest(query=query):
+                response = self.client.get(f'{url}?{query}', headers=bearer(self.admin))
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'cursor': ['Invalid cursor']})
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class FollowTests(TestCase):
+    """
+    Runs FOLLOW_SQL/UNFOLLOW_SQL on PostgreSQL and the ORM fallback
+    elsewhere; both must keep the counters equal to the edges.
+    """
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(username=name) for name in ('alice', 'bob', 'carol')
+        ]
+        self.headers = bearer(self.alice)
+
+    def post(self, name, *args, data=None):
+        return self.client.post(
+            reverse(name, args=args), data, content_type='application/json', headers=self.headers,
+        )
+
+    def assertCounts(self, user, followers, following):
+        user.refresh_from_db()
+        self.assertEqual((user.followers_count, user.following_count), (followers, following))
+        self.assertEqual(user.followers.count(), followers)
+        self.assertEqual(user.following.count(), following)
+
+    def test_cannot_follow_or_unfollow_yourself(self):
+        for name in ('user-follow', 'user-unfollow'):
+            with self.subTest(name=name):
+                self.assertEqual(self.post(name, self.alice.pk).status_code, 400)
+        self.assertCounts(self.alice, 0, 0)
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        response = self.post('user-follow', self.bob.pk)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, True))
+        response = self.post('user-follow', self.bob.pk)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, False))
+        self.assertCounts(self.alice, 0, 1)
+        self.assertCounts(self.bob, 1, 0)
+
+        response = self.post('user-unfollow', self.bob.pk)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, True))
+        response = self.post('user-unfollow', self.bob.pk)
+        self.assertEqual((response.status_code, response.json()['changed']), (200, False))
+        self.assertCounts(self.alice, 0, 0)
+        self.assertCounts(self.bob, 0, 0)
+
+    def test_follow_unknown_user(self):
+        self.assertEqual(self.post('user-follow', 999999).status_code, 404)
+        self.assertCounts(self.alice, 0, 0)
+
+    def test_bulk_follow_skips_self_unknown_and_existing(self):
+        self.post('user-follow', self.bob.pk)
+        ids = [self.alice.pk, self.bob.pk, self.carol.pk, 999999, self.carol.pk]
+        response = self.post('follow-bulk', data={'ids': ids})
+        self.assertEqual(response.json(), {'action': 'follow', 'changed': [self.carol.pk]})
+        self.assertCounts(self.alice, 0, 2)
+        self.assertCounts(self.carol, 1, 0)
+
+        response = self.post('follow-bulk', data={'ids': ids, 'action': 'unfollow'})
+        self.assertEqual(response.json(), {'action': 'unfollow', 'changed': [self.bob.pk, self.carol.pk]})
+        self.assertCounts(self.alice, 0, 0)
+        self.assertCounts(self.bob, 0, 0)
+
+    def test_follow_lists(self):
+        self.post('user-follow', self.bob.pk)
+        self.headers = bearer(self.carol)
+        self.post('user-follow', self.bob.pk)
+        response = self.client.get(reverse('user-followers', args=[self.bob.pk]))
+        self.assertEqual([user['username'] for user in response.json()['results']], ['carol', 'alice'])
+        response = self.client.get(reverse('user-following', args=[self.alice.pk]))
+        self.assertEqual([user['username'] for user in response.json()['results']], ['bob'])
+
+    def test_follow_lists_page_through_tied_timestamps(self):
+        # Bulk follows share one created_at, with sub-millisecond precision
+        others = User.objects.bulk_create([User(username=f'user{i}') for i in range(25)])
+        self.post('follow-bulk', data={'ids': [user.pk for user in others]})
+        Follow.objects.filter(from_user=self.alice).update(created_at=timezone.now().replace(microsecond=123456))
+        expected = sorted((user.pk for user in others), reverse=True)
+
+        url, pages = reverse('user-following', args=[self.alice.pk]), []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([user['id'] for user in data['results']])
+            url, previous = data['next'], data['previous']
+        self.assertEqual(sum(pages, []), expected)
+        # and back from the last page
+        self.assertEqual(self.client.get(previous).json()['results'][-1]['id'], pages[-2][-1])
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        follow_graph.following = None
+        self.alice, self.bob, self.carol, self.dave = [
+            User.objects.create_user(username=name) for name in ('alice', 'bob', 'carol', 'dave')
+        ]
+
+    def follow(self, follower, user, action='user-follow'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse(action, args=[user.pk]), headers=bearer(follower))
+        self.assertEqual(response.status_code, 200)
+
+    def suggestions(self, user):
+        response = self.client.get(reverse('user-suggestions', args=[user.pk]))
+        self.assertEqual(response.status_code, 200)
+        return [(user['username'], user['mutual_count']) for user in response.json()]
+
+    def test_suggestions_follow_the_graph(self):
+        self.suggestions(self.alice)  # builds the graph, later follows arrive as events
+        self.follow(self.alice, self.bob)
+        self.follow(self.bob, self.carol)
+        self.follow(self.alice, self.dave)
+        self.follow(self.dave, self.carol)
+        self.assertEqual(self.suggestions(self.alice), [('carol', 2)])
+
+        self.follow(self.dave, self.carol, 'user-unfollow')
+        self.assertEqual(self.suggestions(self.alice), [('carol', 1)])
+        self.follow(self.alice, self.carol)
+        self.assertEqual(self.suggestions(self.alice), [])
+
+    def test_events_match_a_rebuild(self):
+        self.suggestions(self.alice)
+        self.follow(self.alice, self.bob)
+        self.follow(self.bob, self.carol)
+        follow_graph.sync()
+        incremental = {user_id: list(ids) for user_id, ids in follow_graph.following.items()}
+        follow_graph.rebuild()
+        self.assertEqual(incremental, {user_id: list(ids) for user_id, ids in follow_graph.following.items()})
+
+    def test_unknown_user(self):
+        response = self.client.get(reverse('user-suggestions', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class BlacklistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        blacklist.blacklist_filter.bloom = None
+        self.alice = User.objects.create_user(username='alice')
+
+    def logout(self, refresh):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('logout'), {'refresh': str(refresh)}, headers=bearer(self.alice))
+        self.assertEqual(response.status_code, 205)
+
+    def refresh(self, refresh):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(refresh)}).status_code
+
+    def test_logged_out_refresh_token_is_rejected(self):
+        for shared in (False, True):
+            with self.subTest(shared_cache=shared), mock.patch.object(blacklist, 'uses_shared_cache', return_value=shared):
+                kept, logged_out = [ClaimsTokenObtainPairSerializer.get_token(self.alice) for _ in range(2)]
+                self.assertEqual(self.refresh(logged_out), 200)
+                self.logout(logged_out)
+                self.assertEqual(self.refresh(logged_out), 401)
+                self.assertEqual(self.refresh(kept), 200)
+
+    def test_filter_rules_out_tokens_without_a_query(self):
+        refresh = ClaimsTokenObtainPairSerializer.get_token(self.alice)
+        self.logout(ClaimsTokenObtainPairSerializer.get_token(self.alice))
+        token = blacklist.FilteredRefreshToken(str(refresh), verify=False)
+        with mock.patch.object(blacklist, 'uses_shared_cache', return_value=True):
+            token.check_blacklist()  # builds the filter
+            with self.assertNumQueries(0):
+                token.check_blacklist()
+        with self.assertNumQueries(1):
+            token.check_blacklist()
+
+    def test_purge_deletes_only_expired_tokens(self):
+        expired, live = [ClaimsTokenObtainPairSerializer.get_token(self.alice) for _ in range(2)]
+        for token in (expired, live):
+            self.logout(token)
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(seconds=1))
+        generation = cache.get(blacklist.GENERATION_KEY, 0)
+
+        call_command('purge_expired_tokens', batch_size=1, stdout=StringIO())
+        jtis = [expired['jti'], live['jti']]
+        self.assertEqual(list(OutstandingToken.objects.filter(jti__in=jtis).values_list('jti', flat=True)), [live['jti']])
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), [live['jti']])
+        self.assertEqual(cache.get(blacklist.GENERATION_KEY), generation + 1)
+        self.assertEqual(self.refresh(live), 401)
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class AsyncUserViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(username=name) for name in ('alice', 'bob', 'carol')
+        ]
+        for follower in (self.bob, self.carol):
+            self.client.post(reverse('user-follow', args=[self.alice.pk]), headers=bearer(follower))
+
+    def assertSameResponse(self, name, user_id, query=''):
+        sync = self.client.get(f"{reverse(name, args=[user_id])}?{query}")
+        response = self.client.get(f"{reverse(f'{name}-async', args=[user_id])}?{query}")
+        self.assertEqual(response.status_code, sync.status_code)
+        if sync['Content-Type'] == 'application/json':
+            self.assertEqual(response.json(), sync.json())
+        else:
+            self.assertEqual(async_to_sync(self.read_stream)(response), b''.join(sync.streaming_content))
+        return response
+
+    async def read_stream(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    def test_matches_sync_views(self):
+        for name in ('user-detail', 'user-followers', 'user-following'):
+            for user in (self.alice, self.bob):
+                with self.subTest(name=name, user=user.username):
+                    self.assertSameResponse(name, user.pk)
+            with self.subTest(name=name, user=None):
+                self.assertEqual(self.assertSameResponse(name, 0).status_code, 404)
+        data = self.assertSameResponse('user-followers', self.alice.pk).json()
+        self.assertCountEqual([user['username'] for user in data['results']], ['bob', 'carol'])
+
+    def test_ndjson_export(self):
+        response = self.client.get(f"{reverse('user-followers-async', args=[self.alice.pk])}?export=ndjson")
+        lines = async_to_sync(self.read_stream)(response).splitlines()
+        self.assertCountEqual([json.loads(line)['username'] for line in lines], ['bob', 'carol'])
+        self.assertSameResponse('user-followers', self.alice.pk, query='export=ndjson')
@@ -10,10 +10,12 @@ from .views import (
     EditProfileView,
     UpdateUserRoleView,
     AdminTokenObtainPairView,
+    BulkFollowView,
     follow_user,
     unfollow_user,
     user_followers,
-    user_following
+    user_following,
+    user_suggestions
 )
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -34,7 +36,9 @@ urlpatterns = [
     path('users/<int:id>/set-role/', UpdateUserRoleView.as_view(), name='update-user-role'),
     path('users/<int:id>/follow/', follow_user, name='user-follow'),
     path('users/<int:id>/unfollow/', unfollow_user, name='user-unfollow'),
+    path('follows/bulk/', BulkFollowView.as_view(), name='follow-bulk'),
     path('users/<int:id>/followers/', user_followers, name='user-followers'),
     path('users/<int:id>/following/', user_following, name='user-following'),
+    path('users/<int:id>/suggestions/', user_suggestions, name='user-suggestions'),
     path("admin-login/", AdminTokenObtainPairView.as_view(), name="admin-login"),
 ]
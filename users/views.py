@@ -1,21 +1,38 @@
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status, permissions, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from config.metrics import measure_serialization
+from config.mixins import EagerLoadingMixin
 from .serializers import (
     RegisterSerializer, 
     UserPublicSerializer, 
     UserPrivateSerializer,
+    FollowUserSerializer,
+    BulkFollowSerializer,
+    SuggestedUserSerializer,
     UserEditProfileSerializer, 
     UserRoleUpdateSerializer, 
     AdminTokenObtainPairSerializer
 )
+from .blacklist import FilteredRefreshToken
+from .follows import (
+    NDJSON_CONTENT_TYPE,
+    edge_user,
+    export_ndjson,
+    follow_edges,
+    follow_users,
+    is_export,
+    unfollow_users
+)
 from .permissions import IsRoleAdmin, IsRoleAdminOrStaff
+from .suggestions import follow_graph
 
 User = get_user_model()
 
@@ -31,27 +48,27 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except Exception as e:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 # 3. User List API (public)
-class UserListView(generics.ListAPIView):
+class UserListView(EagerLoadingMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserPublicSerializer
     permission_classes = [permissions.AllowAny]
 
 # 4. User Detail API (public)
-class UserDetailView(generics.RetrieveAPIView):
+class UserDetailView(EagerLoadingMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = UserPublicSerializer
     permission_classes = [permissions.AllowAny]
     lookup_field = 'id' 
 
 # 3.1. User List API (private)
-class UserListPrivateView(generics.ListAPIView):
+class UserListPrivateView(EagerLoadingMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserPrivateSerializer
     permission_classes = [IsRoleAdminOrStaff]
@@ -67,7 +84,7 @@ class UserListPrivateView(generics.ListAPIView):
     
 
 # 4.1. User Detail API (private)
-class UserDetailPrivateView(generics.RetrieveAPIView):
+class UserDetailPrivateView(EagerLoadingMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = UserPrivateSerializer
     permission_classes = [IsRoleAdminOrStaff]
@@ -78,8 +95,9 @@ class ProfileMeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserPrivateSerializer(request.user)
-        return Response(serializer.data)
+        with measure_serialization():
+            data = UserPrivateSerializer(request.user).data
+        return Response(data)
 
 # 6. Edit Profile API (self only)
 class EditProfileView(generics.UpdateAPIView):
@@ -90,7 +108,7 @@ class EditProfileView(generics.UpdateAPIView):
         return self.request.user
     
 # 7. Update User's Role (admin only)
-class UpdateUserRoleView(generics.UpdateAPIView):
+class UpdateUserRoleView(EagerLoadingMixin, generics.UpdateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRoleUpdateSerializer
     permission_classes = [IsRoleAdmin]
@@ -100,57 +118,112 @@ class UpdateUserRoleView(generics.UpdateAPIView):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def follow_user(request, id):
-    try:
-        user_to_follow = User.objects.get(id=id)
-        if user_to_follow == request.user:
-            return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
-        user_to_follow.followers.add(request.user)
-        return Response({"detail": f"You are now following {user_to_follow.username}."}, status=status.HTTP_200_OK)
-    except User.DoesNotExist:
+    if id == request.user.pk:
+        return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
+    followed = follow_users(request.user.pk, [id])
+    # Nothing changed: either already following or no such user
+    username = followed.get(id) or User.objects.filter(id=id).values_list('username', flat=True).first()
+    if username is None:
         return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(
+        {"detail": f"You are now following {username}.", "changed": bool(followed)},
+        status=status.HTTP_200_OK,
+    )
 
 # 9. Unfollow
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def unfollow_user(request, id):
-    try:
-        user_to_unfollow = User.objects.get(id=id)
-        if user_to_unfollow == request.user:
-            return Response({"detail": "You cannot unfollow yourself."}, status=status.HTTP_400_BAD_REQUEST)
-        user_to_unfollow.followers.remove(request.user)
-        return Response({"detail": f"You have unfollowed {user_to_unfollow.username}."}, status=status.HTTP_200_OK)
-    except User.DoesNotExist:
+    if id == request.user.pk:
+        return Response({"detail": "You cannot unfollow yourself."}, status=status.HTTP_400_BAD_REQUEST)
+    unfollowed = unfollow_users(request.user.pk, [id])
+    username = unfollowed.get(id) or User.objects.filter(id=id).values_list('username', flat=True).first()
+    if username is None:
         return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-    
+    return Response(
+        {"detail": f"You have unfollowed {username}.", "changed": bool(unfollowed)},
+        status=status.HTTP_200_OK,
+    )
+
+# 9.1. Bulk follow / unfollow
+class BulkFollowView(APIView):
+    """
+    Follows (or, with "action": "unfollow", unfollows) every user in "ids" in
+    one statement. Unknown ids, your own id and edges already in the
+    requested state are skipped; "changed" lists the ids that were applied.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkFollowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        action = serializer.validated_data['action']
+        apply = follow_users if action == 'follow' else unfollow_users
+        changed = apply(request.user.pk, ids)
+        return Response({"action": action, "changed": sorted(changed)}, status=status.HTTP_200_OK)
+
+# Shared by the followers / following lists
+def follow_list(request, id, kind):
+    """
+    Cursor-paginated, newest follows first. ?export=ndjson streams the whole
+    list instead, one user per line.
+    """
+    if not User.objects.filter(id=id).exists():
+        return Response({"detail": "User not found."}, status=404)
+    edges = follow_edges(id, kind)
+    if is_export(request):
+        serializer = FollowUserSerializer(context={'request': request})
+        return StreamingHttpResponse(export_ndjson(serializer, edges, kind), content_type=NDJSON_CONTENT_TYPE)
+    paginator = api_settings.DEFAULT_PAGINATION_CLASS()
+    page = paginator.paginate_queryset(edges, request)
+    users = [edge_user(follow, kind) for follow in page]
+    with measure_serialization():
+        data = FollowUserSerializer(users, many=True, context={'request': request}).data
+    return paginator.get_paginated_response(data)
+
 # 10. Followers
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def user_followers(request, id):
     """
-    List all followers of the user with id=<id>
+    List followers of the user with id=<id>
     """
-    try:
-        user = User.objects.get(id=id)
-    except User.DoesNotExist:
-        return Response({"detail": "User not found."}, status=404)
-    followers = user.followers.all()
-    serializer = UserPublicSerializer(followers, many=True, context={'request': request})
-    return Response(serializer.data, status=200)
+    return follow_list(request, id, 'followers')
 
 # 11. Following
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def user_following(request, id):
     """
-    List all users the user with id=<id> is following
+    List users the user with id=<id> is following
+    """
+    return follow_list(request, id, 'following')
+
+# 11.1. Who to follow
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def user_suggestions(request, id):
+    """
+    Friend-of-friend suggestions for the user with id=<id>, ranked by how
+    many of the users they follow follow each candidate. ?limit=<n> (max 50).
     """
     try:
-        user = User.objects.get(id=id)
-    except User.DoesNotExist:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+    except ValueError:
+        return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    suggestions = follow_graph.suggest(id, limit)
+    if not suggestions and not User.objects.filter(id=id).exists():
         return Response({"detail": "User not found."}, status=404)
-    following = user.following.all()
-    serializer = UserPublicSerializer(following, many=True, context={'request': request})
-    return Response(serializer.data, status=200)
+    users = User.objects.in_bulk([user_id for user_id, _ in suggestions])
+    results = []
+    for user_id, mutual_count in suggestions:
+        if user_id in users:
+            users[user_id].mutual_count = mutual_count
+            results.append(users[user_id])
+    with measure_serialization():
+        data = SuggestedUserSerializer(results, many=True, context={'request': request}).data
+    return Response(data, status=200)
 
 # 12. Admin Login
 class AdminTokenObtainPairView(TokenObtainPairView):